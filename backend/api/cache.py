@@ -0,0 +1,169 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from recipes.counters import COUNTERS_VERSION
+from recipes.models import Recipe
+from recipes.versions import get_version, reference_cache
+
+
+class LRUCache:
+    """
+    Небольшой потокобезопасный LRU-кеш в памяти процесса.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+local_cache = LRUCache(settings.REFERENCE_CACHE_SIZE)
+
+
+def request_key(request):
+    query = sorted(request.query_params.lists())
+    return f'{request.path}?{query}'
+
+
+class ReferenceDataMixin:
+    """
+    Кеширует ответы list/retrieve для справочников (теги, ингредиенты).
+    Ключ содержит номер версии справочника, который увеличивается
+    сигналами при изменении данных, поэтому устаревшие записи просто
+    перестают запрашиваться. Повторный запрос с If-None-Match или
+    If-Modified-Since получает 304 без обращения к базе.
+    """
+    reference_name = None
+    authentication_classes = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version, modified = get_version(self.reference_name)
+        key = 'reference:{}:{}:{}'.format(
+            self.reference_name, version,
+            hashlib.md5(request_key(request).encode()).hexdigest()
+        )
+        etag = quote_etag(key)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=modified
+        )
+        if response is not None:
+            return response
+
+        data = local_cache.get(key)
+        if data is None:
+            data = reference_cache().get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            reference_cache().set(
+                key, data, settings.REFERENCE_CACHE_TIMEOUT
+            )
+        local_cache.set(key, data)
+
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
+
+
+class ConditionalRecipeMixin:
+    """
+    ETag для списка и карточки рецепта по дешёвому отпечатку: дата
+    последнего изменения и число рецептов в выборке (через кеш счётчика
+    пагинации, если он есть) плюс версии связей
+    пользователя (избранное, корзина, подписки) и справочников.
+    Совпавший If-None-Match получает 304 до сериализации.
+    Счётчики избранного и корзин в отпечаток не входят, кроме списков,
+    отсортированных по ним.
+    """
+    fingerprint_versions = ('tags', 'ingredients', 'users')
+    counter_fields = ('favorites_count', 'cart_count')
+
+    def ordered_by_counter(self, request):
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM, '')
+        return any(
+            field.strip().lstrip('-') in self.counter_fields
+            for field in ordering.split(',')
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(Recipe.objects.all()).order_by()
+        fingerprint = queryset.aggregate(last_updated=Max('updated_at'))
+        if self.ordered_by_counter(request):
+            fingerprint['counters'] = get_version(COUNTERS_VERSION)[0]
+        if hasattr(self.paginator, 'get_count'):
+            fingerprint['total'] = self.paginator.get_count(
+                queryset, request
+            )
+        else:
+            fingerprint['total'] = queryset.count()
+        return self.conditional_response(
+            super().list, fingerprint, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            fingerprint = Recipe.objects.filter(
+                pk=kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+            ).values('updated_at').first()
+        except (ValueError, TypeError):
+            fingerprint = None
+        if fingerprint is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            super().retrieve, fingerprint, request, *args, **kwargs
+        )
+
+    def conditional_response(self, handler, fingerprint, request, *args,
+                             **kwargs):
+        versions = [
+            get_version(name)[0] for name in self.fingerprint_versions
+        ]
+        if request.user.is_authenticated:
+            versions.append(get_version(f'relations:{request.user.id}')[0])
+        etag = quote_etag(hashlib.md5(
+            f'{request.user.id}:{versions}:{sorted(fingerprint.items())}:'
+            f'{request_key(request)}'.encode()
+        ).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,81 @@
+import csv
+
+from recipes.models import Recipe, ShoppingListItem
+
+from .pdf import render_pdf
+
+CHUNK_SIZE = 2000
+
+TITLE = 'Список ингредиентов к покупке:'
+RECIPES_TITLE = 'Список составлен для следующих рецептов:'
+FOOTER = 'Foodgram | Продуктовый Помощник'
+
+
+def cart_ingredients(user):
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total_amount'
+    ).order_by('ingredient__name').iterator(chunk_size=CHUNK_SIZE)
+
+
+def cart_recipes(user):
+    return Recipe.objects.filter(
+        shoppingcart__user=user
+    ).values_list(
+        'name',
+        'author__username'
+    ).order_by('name').iterator(chunk_size=CHUNK_SIZE)
+
+
+def shopping_cart_lines(user):
+    yield TITLE
+    for name, measurement_unit, amount in cart_ingredients(user):
+        yield f'• {name} ({measurement_unit}) - {amount}'
+    yield ''
+    yield RECIPES_TITLE
+    for name, author in cart_recipes(user):
+        yield f'• {name} - {author}'
+    yield ''
+    yield '---'
+    yield FOOTER
+
+
+def export_txt(user):
+    for line in shopping_cart_lines(user):
+        yield f'{line}\n'.encode()
+
+
+class Echo:
+    """
+    Псевдобуфер для csv.writer: возвращает строку вместо записи.
+    """
+    def write(self, value):
+        return value
+
+
+def export_csv(user):
+    writer = csv.writer(Echo())
+    yield '\ufeff'.encode()
+    yield writer.writerow(
+        ('Ингредиент', 'Единица измерения', 'Количество')
+    ).encode()
+    for row in cart_ingredients(user):
+        yield writer.writerow(row).encode()
+    yield writer.writerow(()).encode()
+    yield writer.writerow(('Рецепт', 'Автор')).encode()
+    for row in cart_recipes(user):
+        yield writer.writerow(row).encode()
+
+
+def export_pdf(user):
+    return render_pdf(shopping_cart_lines(user))
+
+
+EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'pdf': export_pdf,
+}
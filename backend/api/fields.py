@@ -0,0 +1,100 @@
+import base64
+import binascii
+import re
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+from rest_framework import serializers
+
+from PIL import Image
+
+DATA_URI = re.compile(r'^data:(?P<type>[\w/+.-]*)(?:;[\w=-]+)*?;base64,')
+WHITESPACE = re.compile(r'\s')
+CHUNK_SIZE = 64 * 1024
+IMAGE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class StreamingImageField(serializers.ImageField):
+    """
+    Изображение строкой base64 (можно с префиксом data:) или файлом
+    из multipart/form-data. Base64 декодируется по частям во временный
+    файл, который переходит на диск после IMAGE_SPOOL_MAX_SIZE байт.
+    Размер проверяется до декодирования, ширина и высота — по заголовку,
+    до распаковки пикселей.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Неверная строка base64.',
+        'invalid_image': (
+            'Загрузите корректное изображение '
+            '(JPEG, PNG, GIF или WebP).'
+        ),
+        'too_large': 'Размер изображения больше {max_bytes} байт.',
+        'too_many_pixels': (
+            'Изображение больше {max_side}×{max_side} точек '
+            'или {max_pixels} точек всего.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail('invalid_image')
+        if data.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail_too_large()
+        image_format = self.validate_image(data)
+        data.name = f'{uuid.uuid4()}.{EXTENSIONS[image_format]}'
+        data.content_type = Image.MIME[image_format]
+        data.seek(0)
+        return data
+
+    def fail_too_large(self):
+        self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+
+    def decode(self, data):
+        match = DATA_URI.match(data)
+        start = match.end() if match else 0
+        if WHITESPACE.search(data, start):
+            data = WHITESPACE.sub('', data[start:])
+            start = 0
+        if (len(data) - start) * 3 // 4 > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail_too_large()
+
+        file = SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_MAX_SIZE)
+        size = 0
+        try:
+            for offset in range(start, len(data), CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    data[offset:offset + CHUNK_SIZE], validate=True
+                )
+                file.write(chunk)
+                size += len(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return UploadedFile(file=file, name='image', size=size)
+
+    def validate_image(self, file):
+        try:
+            image = Image.open(file)
+            width, height = image.size
+            if (
+                max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE
+                or width * height > settings.RECIPE_IMAGE_MAX_PIXELS
+            ):
+                self.fail(
+                    'too_many_pixels',
+                    max_side=settings.RECIPE_IMAGE_MAX_SIDE,
+                    max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+                )
+            image.verify()
+        except IMAGE_ERRORS:
+            self.fail('invalid_image')
+        if image.format not in EXTENSIONS:
+            self.fail('invalid_image')
+        return image.format
@@ -1,10 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 
 from rest_framework.exceptions import NotAuthenticated
+from rest_framework.filters import OrderingFilter, SearchFilter
 
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.autocomplete import search_ingredients
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
@@ -17,7 +21,8 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name="slug",
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
 
@@ -25,6 +30,24 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ['author', 'tags']
 
+    @staticmethod
+    def filter_exists(queryset, name, subquery):
+        """
+        Полусоединение через EXISTS: в отличие от JOIN не размножает
+        строки рецептов и не требует DISTINCT.
+        """
+        return queryset.annotate(**{
+            name: Exists(subquery.filter(recipe=OuterRef('pk')))
+        }).filter(**{name: True})
+
+    def filter_tags(self, queryset, field_name, value):
+        if not value:
+            return queryset
+        return self.filter_exists(
+            queryset, 'has_tags',
+            Recipe.tags.through.objects.filter(tag__in=value)
+        )
+
     def filter_favorited(self, queryset, field_name, value):
         user = self.request.user
         if user.is_anonymous:
@@ -32,7 +55,9 @@ class RecipeFilter(FilterSet):
                 'Войдите или зарегистрируйтесь, чтобы просматривать избранное.'
             )
         if value:
-            return queryset.filter(favorited__user=user)
+            return self.filter_exists(
+                queryset, 'in_favorites', Favorite.objects.filter(user=user)
+            )
         return queryset
 
     def filter_shopping_cart(self, queryset, field_name, value):
@@ -43,13 +68,39 @@ class RecipeFilter(FilterSet):
                 'свой список покупок.'
             )
         if value:
-            return queryset.filter(shoppingcart__user=user)
+            return self.filter_exists(
+                queryset, 'in_shopping_cart',
+                ShoppingCart.objects.filter(user=user)
+            )
         return queryset
 
 
+class RecipeSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск ?search= по названию, описанию, ингредиентам
+    и тегам рецепта. Без явного ?ordering= выдача упорядочена по
+    релевантности, затем по сортировке по умолчанию.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        queryset, rank = search_recipes(queryset, query)
+        if (
+            rank is None
+            or OrderingFilter.ordering_param in request.query_params
+        ):
+            return queryset
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.order_by(rank.desc(), *ordering)
+
+
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def filter_name(self, queryset, field_name, value):
+        return search_ingredients(queryset, value)
@@ -1,4 +1,150 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.versions import get_version
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по курсору: следующая страница выбирается
+    условием по значениям полей сортировки последней записи, без OFFSET
+    и без COUNT(*). Сортировка берётся из атрибута cursor_ordering
+    представления, параметр ?ordering= в этом режиме не учитывается.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 20
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def after(self, position, ordering=None):
+        """
+        Условие «строго после position» для составного ключа сортировки:
+        (a < x) OR (a = x AND b < y) ... с учётом направления каждого поля.
+        """
+        ordering = ordering or self.ordering
+        condition = Q()
+        equal = Q()
+        for item, value in zip(ordering, position):
+            field = item.lstrip('-')
+            lookup = 'lt' if item.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields(), values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_for(self, obj):
+        """
+        Курсор на записи, следующие за obj.
+        """
+        values = [
+            obj._meta.get_field(field).value_to_string(obj)
+            for field in self.fields()
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def encode_cursor(self, obj):
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.cursor_for(obj)
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсор по ленте, собранной из нескольких источников (метод
+    get_feed_sources представления): каждый источник отдаёт ключи
+    сортировки следующей страницы своим запросом по индексу, ключи
+    сливаются, а рецепты страницы загружаются одним запросом.
+    Все источники сортируются по убыванию (pub_date, id рецепта).
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+
+        keys = set()
+        for source, ordering in view.get_feed_sources(request.user):
+            if position is not None:
+                source = source.filter(self.after(position, ordering))
+            keys.update(source.order_by(*ordering).values_list(
+                *(field.lstrip('-') for field in ordering)
+            )[:page_size + 1])
+        keys = sorted(keys, reverse=True)
+        self.has_next = len(keys) > page_size
+
+        ids = [recipe_id for _, recipe_id in keys[:page_size]]
+        recipes = queryset.in_bulk(ids)
+        self.page = [recipes[pk] for pk in ids if pk in recipes]
+        return self.page
 
 
 class LimitPagination(PageNumberPagination):
@@ -6,3 +152,128 @@ class LimitPagination(PageNumberPagination):
     page_query_param = 'page'
     page_size_query_param = 'limit'
     max_page_size = 20
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class KnownCountPaginator(Paginator):
+    """
+    Пагинатор с заранее известным (возможно, приблизительным или
+    слегка устаревшим) числом записей: страница не обрезается по count,
+    а номера страниц за пределами count не считаются ошибкой.
+    """
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @property
+    def count(self):
+        return self.known_count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+
+class CachedCountPagination(LimitPagination):
+    """
+    Кеширует COUNT(*) отфильтрованной выборки по нормализованному набору
+    фильтров и версии данных; короткий TTL ограничивает расхождение
+    от изменений, которые версию не меняют. Для выборки без фильтров на
+    большой таблице Postgres берёт оценку из pg_class.reltuples.
+    В ответе поле count_is_exact показывает, точное ли число.
+    """
+    count_cache_timeout = 30
+    estimate_threshold = 100000
+    ignored_query_params = ('page', 'limit', 'cursor', 'ordering')
+    user_query_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_count_key(self, queryset, request):
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+            if key not in self.ignored_query_params
+        )
+        versions = [get_version('recipes')[0]]
+        user_id = None
+        if any(key in self.user_query_params for key, _ in params):
+            user_id = request.user.id
+            versions.append(get_version(f'relations:{user_id}')[0])
+        key = f'{queryset.model._meta.label}:{versions}:{user_id}:{params}'
+        return 'count:' + hashlib.md5(key.encode()).hexdigest(), not params
+
+    def estimate_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return None
+        return row[0]
+
+    def get_count(self, queryset, request):
+        key, unfiltered = self.get_count_key(queryset, request)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        count = self.estimate_count(queryset) if unfiltered else None
+        cached = (count, False)
+        if count is None:
+            cached = (queryset.count(), True)
+        cache.set(key, cached, self.count_cache_timeout)
+        return cached
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_is_exact = None
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_param not in request.query_params:
+            count, self.count_is_exact = self.get_count(queryset, request)
+            self.django_paginator_class = partial(
+                KnownCountPaginator, count=count
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count_is_exact is not None:
+            response.data = OrderedDict([
+                ('count', response.data['count']),
+                ('count_is_exact', self.count_is_exact),
+                *(
+                    (key, value) for key, value in response.data.items()
+                    if key != 'count'
+                )
+            ])
+        return response
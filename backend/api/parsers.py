@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    multipart/form-data, где поле data содержит JSON с полями объекта,
+    а файлы (например, image) идут отдельными частями без base64.
+    """
+    data_field = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        data = {}
+        if self.data_field in parsed.data:
+            try:
+                data = json.loads(parsed.data[self.data_field])
+            except ValueError as error:
+                raise ParseError(
+                    f'Неверный JSON в поле {self.data_field}: {error}'
+                )
+            if not isinstance(data, dict):
+                raise ParseError(
+                    f'Поле {self.data_field} должно содержать объект JSON.'
+                )
+        data.update(parsed.files.dict())
+        return data
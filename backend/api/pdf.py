@@ -0,0 +1,130 @@
+import textwrap
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 11
+LEADING = 15
+LINE_WIDTH = 85
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+# Стандартный шрифт Helvetica не встраивается в файл, поэтому кириллица
+# кодируется в cp1251, а глифы задаются по именам через /Differences.
+CYRILLIC_GLYPHS = (
+    '168 /afii10023 184 /afii10071 192 '
+    + ' '.join(
+        f'/afii{code}'
+        for code in (
+            *range(10017, 10023), *range(10024, 10050),
+            *range(10065, 10071), *range(10072, 10098)
+        )
+    )
+)
+
+FONT_OBJECTS = {
+    3: (
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+        '/Encoding 4 0 R >>'
+    ),
+    4: (
+        '<< /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+        f'/Differences [{CYRILLIC_GLYPHS}] >>'
+    ),
+}
+
+
+def escape(line):
+    encoded = line.encode('cp1251', errors='replace')
+    return (
+        encoded.replace(b'\\', b'\\\\')
+        .replace(b'(', b'\\(')
+        .replace(b')', b'\\)')
+    )
+
+
+def wrap(lines):
+    for line in lines:
+        yield from textwrap.wrap(line, LINE_WIDTH) or ['']
+
+
+def page_content(lines):
+    content = [
+        b'BT',
+        f'/F1 {FONT_SIZE} Tf {LEADING} TL'.encode(),
+        f'{MARGIN} {PAGE_HEIGHT - MARGIN} Td'.encode(),
+    ]
+    content.extend(b'(' + escape(line) + b') Tj T*' for line in lines)
+    content.append(b'ET')
+    return b'\n'.join(content)
+
+
+def render_pdf(lines):
+    """
+    Генератор PDF-документа: страницы отдаются по мере заполнения,
+    таблица ссылок строится в конце по накопленным смещениям.
+    """
+    offsets = {}
+    position = 0
+
+    def write(number, body):
+        nonlocal position
+        offsets[number] = position
+        chunk = f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+        position += len(chunk)
+        return chunk
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position += len(header)
+    yield header
+    yield write(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    for number, body in FONT_OBJECTS.items():
+        yield write(number, body.encode())
+
+    pages = []
+    next_number = 5
+    page_lines = []
+    for line in wrap(lines):
+        page_lines.append(line)
+        if len(page_lines) < LINES_PER_PAGE:
+            continue
+        pages.append(next_number + 1)
+        yield from write_page(write, next_number, page_lines)
+        next_number += 2
+        page_lines = []
+    if page_lines or not pages:
+        pages.append(next_number + 1)
+        yield from write_page(write, next_number, page_lines)
+        next_number += 2
+
+    kids = ' '.join(f'{number} 0 R' for number in pages)
+    yield write(
+        2, f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode()
+    )
+
+    xref = [f'xref\n0 {next_number}\n0000000000 65535 f \n']
+    xref.extend(
+        f'{offsets[number]:010d} 00000 n \n'
+        for number in range(1, next_number)
+    )
+    xref.append(
+        f'trailer\n<< /Size {next_number} /Root 1 0 R >>\n'
+        f'startxref\n{position}\n%%EOF\n'
+    )
+    yield ''.join(xref).encode()
+
+
+def write_page(write, number, lines):
+    content = page_content(lines)
+    yield write(
+        number,
+        f'<< /Length {len(content)} >>\nstream\n'.encode()
+        + content + b'\nendstream'
+    )
+    yield write(
+        number + 1,
+        (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} '
+            f'{PAGE_HEIGHT}] /Resources << /Font << /F1 3 0 R >> >> '
+            f'/Contents {number} 0 R >>'
+        ).encode()
+    )
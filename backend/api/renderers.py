@@ -0,0 +1,32 @@
+import json
+
+from rest_framework import renderers
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """
+    Выбирает формат выгрузки по параметру ?format=.
+    Сам файл отдаётся потоком, через рендерер проходят только ошибки.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class PlainTextRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
@@ -1,34 +1,124 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from djoser.serializers import UserCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
 
+from foodgram.metrics import serializer_timer
+from recipes.images import variant_names
+from recipes.matching import ingredients_changed
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeQuerySet,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
 from users.models import Follow
 
+from .fields import StreamingImageField
+
 RECIPES_LIMIT_DEFAULT = '6'
+RECIPES_LIMIT_MAX = 20
+MATCH_INGREDIENTS_MAX = 50
 
 User = get_user_model()
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params.get(
+            'recipes_limit', RECIPES_LIMIT_DEFAULT
+        ))
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Укажите целое число.'}
+        )
+    if recipes_limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Число не может быть отрицательным.'}
+        )
+    return min(recipes_limit, RECIPES_LIMIT_MAX)
+
+
+def get_ingredient_ids(request):
+    """
+    id ингредиентов из ?ingredients=1,2,3 (или ?ingredients=1&ingredients=2).
+    """
+    values = [
+        value
+        for param in request.query_params.getlist('ingredients')
+        for value in param.split(',') if value.strip()
+    ]
+    if not values:
+        raise serializers.ValidationError(
+            {'ingredients': 'Укажите id ингредиентов.'}
+        )
+    if len(values) > MATCH_INGREDIENTS_MAX:
+        raise serializers.ValidationError({
+            'ingredients':
+                f'Не больше {MATCH_INGREDIENTS_MAX} ингредиентов за раз.'
+        })
+    try:
+        return {int(value) for value in values}
+    except ValueError:
+        raise serializers.ValidationError(
+            {'ingredients': 'Укажите целые числа через запятую.'}
+        )
+
+
+class TimedSerializerMixin:
+    """
+    Время сериализации ответа для метрик запроса.
+    """
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class RecipeImagesField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии обложки по размерам и форматам.
+    Пока копии не готовы, все ссылки ведут на оригинал.
+    """
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        request = self.context.get('request')
+
+        def url(name):
+            url = recipe.image.storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        ready = recipe.image_variants == recipe.image.name
+        original = url(recipe.image.name)
+        return {
+            size: {
+                image_format: url(name) if ready else original
+                for image_format, name in formats.items()
+            }
+            for size, formats in variant_names(recipe.image.name).items()
+        }
+
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
@@ -37,17 +127,19 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'id', 'username', 'email', 'first_name', 'last_name',
-            'is_subscribed'
+            'is_subscribed', 'recipes_count', 'followers_count'
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -56,14 +148,9 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        read_only=False,
-        queryset=Ingredient.objects.all(),
-        source='ingredient.id'
+    id = serializers.IntegerField(
+        read_only=False, source='ingredient.id'
     )
-    # id = serializers.IntegerField(
-    #     read_only=False, source='ingredient.id'
-    # )
     name = serializers.CharField(
         read_only=True, source='ingredient.name'
     )
@@ -77,7 +164,9 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('name', 'measurement_unit')
 
 
-class RecipeRepresentationSerializer(serializers.ModelSerializer):
+class RecipeRepresentationSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     ingredients = RecipeIngredientSerializer(
         many=True, read_only=True, source='recipe_ingredients'
     )
@@ -85,16 +174,25 @@ class RecipeRepresentationSerializer(serializers.ModelSerializer):
     author = UserSerializer(many=False, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'ingredients', 'tags', 'author', 'image', 'name', 'text',
-            'cooking_time', 'is_in_shopping_cart', 'is_favorited'
+            'id', 'ingredients', 'tags', 'author', 'image', 'images', 'name',
+            'text', 'cooking_time', 'is_in_shopping_cart', 'is_favorited',
+            'favorites_count', 'cart_count'
         )
         read_only_fields = fields
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -102,6 +200,8 @@ class RecipeRepresentationSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -113,11 +213,10 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(
         many=True, read_only=False, source='recipe_ingredients'
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, read_only=False,
-        queryset=Tag.objects.values_list('id', flat=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), read_only=False
     )
-    image = Base64ImageField(required=True, read_only=False)
+    image = StreamingImageField(required=True)
 
     class Meta:
         model = Recipe
@@ -127,32 +226,45 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        if not data['recipe_ingredients']:
+        if 'recipe_ingredients' in data:
+            self.validate_ingredients_data(data['recipe_ingredients'])
+        if 'tags' in data:
+            self.validate_tags_data(data['tags'])
+        return data
+
+    def validate_ingredients_data(self, ingredients):
+        if not ingredients:
             raise serializers.ValidationError("Список ингредиентов пустой.")
 
-        if not data['tags']:
+        ingredints = [data['ingredient']['id'] for data in ingredients]
+        if len(ingredints) != len(set(ingredints)):
+            raise serializers.ValidationError("Ингредиенты повторяются.")
+
+        if Ingredient.objects.filter(
+            id__in=ingredints
+        ).count() != len(ingredints):
+            raise serializers.ValidationError("Ингредиент не найден.")
+
+    def validate_tags_data(self, tags):
+        if not tags:
             raise serializers.ValidationError("Список тегов пустой.")
 
-        if len(data['tags']) != len(set(data['tags'])):
+        if len(tags) != len(set(tags)):
             raise serializers.ValidationError("Теги повторяются.")
 
-        ingredints = [
-            data['ingredient']['id'] for data in data['recipe_ingredients']
-        ]
-        if len(ingredints) != len(set(ingredints)):
-            raise serializers.ValidationError("Ингредиенты повторяются.")
-
-        return data
+        if Tag.objects.filter(id__in=tags).count() != len(tags):
+            raise serializers.ValidationError("Тег не найден.")
 
     def set_ingredients(self, recipe, ingredients):
         objs = [RecipeIngredient(
             recipe=recipe,
-            ingredient=data['ingredient']['id'],
+            ingredient_id=data['ingredient']['id'],
             amount=int(data['amount'])
         ) for data in ingredients]
 
         return RecipeIngredient.objects.bulk_create(objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tags')
@@ -161,36 +273,91 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         self.set_ingredients(recipe, ingredients_data)
         recipe.tags.set(tags)
+        transaction.on_commit(lambda: ingredients_changed([recipe.id]))
 
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        amounts = {
+            data['ingredient']['id']: int(data['amount'])
+            for data in ingredients
+        }
+
+        to_create = []
+        to_update = []
+        deltas = {}
+        for ingredient_id, amount in amounts.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+                deltas[ingredient_id] = amount
+            elif recipe_ingredient.amount != amount:
+                deltas[ingredient_id] = amount - recipe_ingredient.amount
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        to_delete = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            if ingredient_id not in amounts:
+                to_delete.append(recipe_ingredient.id)
+                deltas[ingredient_id] = -recipe_ingredient.amount
+
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if deltas:
+            ShoppingListItem.objects.update_recipe(recipe, deltas)
+
+    def update_tags(self, recipe, tags):
+        existing = {tag.id for tag in recipe.tags.all()}
+        tags = set(tags)
+        if tags - existing:
+            recipe.tags.add(*(tags - existing))
+        if existing - tags:
+            recipe.tags.remove(*(existing - tags))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
+        if {'recipe_ingredients', 'tags'} & validated_data.keys():
+            instance.similar_stale = True
         if 'recipe_ingredients' in validated_data:
-            RecipeIngredient.objects.filter(
-                recipe=instance
-            ).delete()
-            ingredients_data = validated_data.pop('recipe_ingredients')
-            self.set_ingredients(instance, ingredients_data)
+            self.update_ingredients(
+                instance, validated_data.pop('recipe_ingredients')
+            )
+            transaction.on_commit(
+                lambda: ingredients_changed([instance.id])
+            )
 
         if 'tags' in validated_data:
-            tags = validated_data.pop('tags')
-            instance.tags.set(tags)
+            self.update_tags(instance, validated_data.pop('tags'))
 
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], *RecipeQuerySet.related_lookups()
+        )
         return RecipeRepresentationSerializer(
             instance,
             context={'request': self.context.get('request')}
         ).data
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'image', 'cooking_time'
+            'id', 'name', 'image', 'images', 'cooking_time'
         )
 
 
@@ -217,43 +384,41 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ).data
 
 
-class UserListSerializer(UserCreateSerializer):
+class UserListSerializer(TimedSerializerMixin, UserCreateSerializer):
 
     class Meta:
         model = User
         fields = (
-            'id', 'username', 'password', 'email', 'first_name', 'last_name'
+            'id', 'username', 'password', 'email', 'first_name', 'last_name',
+            'recipes_count', 'followers_count'
         )
         read_only_fields = ('id',)
 
 
 class SubscriptionsSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'recipes', 'recipes_count'
+            'is_subscribed', 'recipes', 'recipes_count', 'followers_count'
         )
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes_limit = request.query_params.get(
-            'recipes_limit', RECIPES_LIMIT_DEFAULT
-        )
-
-        recipes = Recipe.objects.filter(author=obj)[:int(recipes_limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = Recipe.objects.filter(
+                author=obj
+            )[:get_recipes_limit(request)]
 
         serializer = RecipeListSerializer(
             recipes, many=True, context={'request': request}
         )
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
     queryset = User.objects.all()
@@ -302,6 +467,14 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             )
         ]
 
+    @transaction.atomic
+    def create(self, validated_data):
+        shopping_cart = super().create(validated_data)
+        ShoppingListItem.objects.add_recipe(
+            shopping_cart.user, shopping_cart.recipe
+        )
+        return shopping_cart
+
     def to_representation(self, instance):
         return RecipeListSerializer(
             instance.recipe,
@@ -0,0 +1,451 @@
+import base64
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TrendingRecipe
+)
+from users.models import Follow, User
+
+RECIPES_URL = '/api/recipes/'
+RECIPE_URL = '/api/recipes/{}/'
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def image_base64():
+    image = io.BytesIO()
+    Image.new('RGB', (4, 4), (200, 100, 0)).save(image, 'PNG')
+    encoded = base64.b64encode(image.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeAPITestCase(APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com', password='pass'
+            )
+            for number in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag{number}', color='#000000'
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+
+    def setUp(self):
+        clear_caches()
+
+    def authenticate(self, user=None):
+        token = self.token if user is None else Token.objects.create(
+            user=user
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def create_recipes(self, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=self.authors[number % len(self.authors)],
+                name=f'Рецепт {number}', text='Описание',
+                image='recipes/image.png', cooking_time=10
+            )
+            recipe.tags.set(self.tags[:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+                for ingredient in self.ingredients[:3]
+            )
+            recipes.append(recipe)
+        clear_caches()
+        return recipes
+
+    def recipe_data(self, ingredients_count, tags_count):
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 50}
+                for ingredient in self.ingredients[:ingredients_count]
+            ],
+            'tags': [tag.id for tag in self.tags[:tags_count]],
+            'image': image_base64(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return context.captured_queries
+
+    def assert_constant_queries(self, url, extra_recipes=5):
+        """
+        Число запросов к url не растёт с числом рецептов.
+        """
+        expected = len(self.count_queries(url))
+        self.create_recipes(extra_recipes)
+        with self.assertNumQueries(expected):
+            self.client.get(url)
+
+
+class RecipeListQueriesTest(RecipeAPITestCase):
+
+    def test_anonymous_list_is_constant(self):
+        self.create_recipes(2)
+        self.assert_constant_queries(RECIPES_URL)
+
+    def test_authenticated_list_is_constant(self):
+        recipes = self.create_recipes(2)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        Follow.objects.create(user=self.user, following=self.authors[0])
+        self.authenticate()
+        self.assert_constant_queries(RECIPES_URL)
+
+    def test_user_flags_come_from_annotations(self):
+        recipes = self.create_recipes(3)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        self.authenticate()
+
+        queries = self.count_queries(RECIPES_URL)
+        for table in (Favorite._meta.db_table, ShoppingCart._meta.db_table):
+            flag_queries = [
+                query['sql'] for query in queries if table in query['sql']
+            ]
+            self.assertTrue(flag_queries)
+            for sql in flag_queries:
+                self.assertIn('EXISTS', sql)
+
+        results = {
+            recipe['id']: recipe
+            for recipe in self.client.get(RECIPES_URL).data['results']
+        }
+        self.assertTrue(results[recipes[0].id]['is_favorited'])
+        self.assertFalse(results[recipes[0].id]['is_in_shopping_cart'])
+        self.assertFalse(results[recipes[1].id]['is_favorited'])
+        self.assertTrue(results[recipes[1].id]['is_in_shopping_cart'])
+        self.assertFalse(results[recipes[2].id]['is_favorited'])
+
+    def test_anonymous_flags_are_false_without_queries(self):
+        recipes = self.create_recipes(2)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+
+        queries = self.count_queries(RECIPES_URL)
+        self.assertFalse([
+            query for query in queries
+            if Favorite._meta.db_table in query['sql']
+        ])
+        for recipe in self.client.get(RECIPES_URL).data['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['is_in_shopping_cart'])
+
+
+class RecipeQueriesTest(RecipeAPITestCase):
+    """
+    Ответы с рецептом собираются через with_related(): число запросов
+    не зависит от числа ингредиентов и тегов.
+    """
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.authors[0])
+
+    def save_queries(self, method, url, data, status):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.data)
+        return len(context.captured_queries), response
+
+    def test_list_does_not_depend_on_nested_objects(self):
+        self.create_recipes(2)
+        expected = len(self.count_queries(RECIPES_URL))
+        for recipe in self.create_recipes(3):
+            recipe.tags.set(self.tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in self.ingredients[3:]
+            )
+        clear_caches()
+        with self.assertNumQueries(expected):
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            sorted(len(recipe['ingredients'])
+                   for recipe in response.data['results']),
+            [3, 3, 6, 6, 6]
+        )
+
+    def test_retrieve_does_not_depend_on_nested_objects(self):
+        small, large = self.create_recipes(2)
+        large.tags.set(self.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=large, ingredient=ingredient, amount=10)
+            for ingredient in self.ingredients[3:]
+        )
+        clear_caches()
+        expected = len(self.count_queries(RECIPE_URL.format(small.id)))
+        with self.assertNumQueries(expected):
+            response = self.client.get(RECIPE_URL.format(large.id))
+        self.assertEqual(len(response.data['ingredients']), 6)
+        self.assertEqual(len(response.data['tags']), 3)
+
+    def test_retrieve_with_invalid_pk_is_not_found(self):
+        for pk in ('abc', '0'):
+            response = self.client.get(RECIPE_URL.format(pk))
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('ETag', response)
+
+    def test_create_does_not_depend_on_nested_objects(self):
+        expected, _ = self.save_queries(
+            'post', RECIPES_URL, self.recipe_data(1, 1), 201
+        )
+        with self.assertNumQueries(expected):
+            response = self.client.post(
+                RECIPES_URL, self.recipe_data(6, 3), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['ingredients']), 6)
+
+    def test_update_does_not_depend_on_nested_objects(self):
+        _, response = self.save_queries(
+            'post', RECIPES_URL, self.recipe_data(1, 1), 201
+        )
+        url = RECIPE_URL.format(response.data['id'])
+        expected, _ = self.save_queries(
+            'put', url, self.recipe_data(2, 2), 200
+        )
+        _, response = self.save_queries(
+            'post', RECIPES_URL, self.recipe_data(1, 1), 201
+        )
+        url = RECIPE_URL.format(response.data['id'])
+        with self.assertNumQueries(expected):
+            response = self.client.put(
+                url, self.recipe_data(6, 3), format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data['tags']), 3)
+
+
+class RecipeUpdateWritesTest(RecipeAPITestCase):
+    """
+    Обновление рецепта пишет в базу только изменившиеся строки.
+    """
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.authors[0])
+        response = self.client.post(
+            RECIPES_URL, self.recipe_data(3, 2), format='json'
+        )
+        self.recipe = Recipe.objects.get(pk=response.data['id'])
+        self.url = RECIPE_URL.format(self.recipe.id)
+
+    def patch_writes(self, data):
+        """
+        Таблицы, в которые писал PATCH: [(операция, таблица)].
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        writes = []
+        for query in context.captured_queries:
+            words = query['sql'].replace('"', '').split()
+            if words[0] == 'UPDATE':
+                writes.append(('UPDATE', words[1]))
+            elif words[0] in ('INSERT', 'DELETE'):
+                writes.append((words[0], words[2]))
+        return writes
+
+    def ingredients_data(self, amounts):
+        return [
+            {'id': self.ingredients[number].id, 'amount': amount}
+            for number, amount in amounts.items()
+        ]
+
+    def shopping_list(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'total_amount'
+        ))
+
+    def test_name_only_touches_recipe_row(self):
+        ingredient_ids = list(
+            self.recipe.recipe_ingredients.values_list('id', flat=True)
+        )
+        writes = self.patch_writes({'name': 'Новое название'})
+        self.assertEqual(writes, [('UPDATE', Recipe._meta.db_table)])
+        self.assertEqual(ingredient_ids, list(
+            self.recipe.recipe_ingredients.values_list('id', flat=True)
+        ))
+
+    def test_unchanged_ingredients_and_tags_are_not_written(self):
+        writes = self.patch_writes({
+            'ingredients': self.ingredients_data({0: 50, 1: 50, 2: 50}),
+            'tags': [tag.id for tag in self.tags[:2]],
+        })
+        self.assertEqual(writes, [('UPDATE', Recipe._meta.db_table)])
+
+    def test_one_changed_amount_is_one_update(self):
+        writes = self.patch_writes({
+            'ingredients': self.ingredients_data({0: 50, 1: 75, 2: 50}),
+        })
+        self.assertEqual(writes, [
+            ('UPDATE', RecipeIngredient._meta.db_table),
+            ('UPDATE', Recipe._meta.db_table),
+        ])
+        self.assertEqual(
+            self.recipe.ingredient_amounts()[self.ingredients[1].id], 75
+        )
+
+    def test_tag_changes_touch_only_changed_links(self):
+        writes = self.patch_writes({
+            'tags': [self.tags[0].id, self.tags[2].id],
+        })
+        tags_table = Recipe.tags.through._meta.db_table
+        self.assertEqual(writes, [
+            ('INSERT', tags_table),
+            ('DELETE', tags_table),
+            ('UPDATE', Recipe._meta.db_table),
+        ])
+        self.assertEqual(
+            set(self.recipe.tags.values_list('id', flat=True)),
+            {self.tags[0].id, self.tags[2].id}
+        )
+
+    def test_shopping_lists_get_ingredient_deltas(self):
+        other = self.create_recipes(1)[0]
+        for user in (self.user, self.authors[1]):
+            ShoppingCart.objects.create(user=user, recipe=self.recipe)
+            ShoppingListItem.objects.add_recipe(user, self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=other)
+        ShoppingListItem.objects.add_recipe(self.user, other)
+
+        self.patch_writes({
+            'ingredients': self.ingredients_data({0: 50, 1: 20, 3: 5}),
+        })
+
+        first, second, third, fourth = (
+            ingredient.id for ingredient in self.ingredients[:4]
+        )
+        self.assertEqual(self.shopping_list(self.user), {
+            first: 150, second: 120, third: 100, fourth: 5,
+        })
+        self.assertEqual(self.shopping_list(self.authors[1]), {
+            first: 50, second: 20, fourth: 5,
+        })
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.authors[2]
+        ).exists())
+
+
+class RecipeCounterETagTest(RecipeAPITestCase):
+    """
+    Счётчики избранного, корзин и подписок не сбрасывают ETag
+    рецептов у остальных пользователей.
+    """
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(1)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assert_not_modified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_relations_keep_etags(self):
+        urls = (RECIPES_URL, RECIPE_URL.format(self.recipe.id))
+        etags = [self.etag(url) for url in urls]
+        updated_at = self.recipe.updated_at
+        Favorite.objects.create(user=self.authors[1], recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.authors[1], recipe=self.recipe)
+        Follow.objects.create(user=self.authors[1], following=self.authors[0])
+        for url, etag in zip(urls, etags):
+            self.assert_not_modified(url, etag)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.updated_at, updated_at)
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.cart_count, 1)
+
+    def test_counter_ordering_follows_counters(self):
+        url = f'{RECIPES_URL}?ordering=-favorites_count'
+        etag = self.etag(url)
+        self.assert_not_modified(url, etag)
+        Favorite.objects.create(user=self.authors[1], recipe=self.recipe)
+        self.assertNotEqual(self.etag(url), etag)
+
+
+class TrendingRefreshTest(RecipeAPITestCase):
+    """
+    События учитываются с запаздыванием TRENDING_EVENT_DELAY ровно
+    один раз, даже если запись зафиксирована после пересчёта.
+    """
+    def favorite(self, user, created):
+        favorite = Favorite.objects.create(user=user, recipe=self.recipe)
+        Favorite.objects.filter(pk=favorite.pk).update(created=created)
+
+    def test_late_events_are_counted_once(self):
+        self.recipe, = self.create_recipes(1)
+        delay = timedelta(seconds=settings.TRENDING_EVENT_DELAY)
+        now = timezone.now()
+        self.favorite(self.authors[0], now - 2 * delay)
+        self.favorite(self.authors[1], now - delay / 2)
+        self.assertEqual(TrendingRecipe.objects.refresh(now), 1)
+        # Зафиксировано после пересчёта, но с более ранним created.
+        self.favorite(self.authors[2], now - delay / 4)
+        later = now + 2 * delay
+        self.assertEqual(TrendingRecipe.objects.refresh(later), 2)
+        self.assertEqual(TrendingRecipe.objects.refresh(later), 0)
+        self.assertEqual(
+            TrendingRecipe.objects.refresh(later + 2 * delay), 0
+        )
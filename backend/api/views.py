@@ -1,30 +1,40 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+from django.http import StreamingHttpResponse
 
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 
+from recipes.matching import match_recipes
 from recipes.models import (
     Favorite,
+    FeedEntry,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
 from users.models import Follow
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import LimitPagination
+from .cache import ConditionalRecipeMixin, ReferenceDataMixin
+from .exports import EXPORTERS
+from .filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
+from .pagination import CachedCountPagination, FeedPagination, LimitPagination
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from .serializers import (
     FavoriteSerializer,
     IngredientSerializer,
@@ -32,27 +42,34 @@ from .serializers import (
     ShoppingCartSerializer,
     SubscribeSerializer,
     SubscriptionsSerializer,
-    TagSerializer
+    TagSerializer,
+    get_ingredient_ids,
+    get_recipes_limit
 )
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalRecipeMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [
         IsAuthorOrReadOnly,
     ]
-    pagination_class = LimitPagination
+    pagination_class = CachedCountPagination
+    parser_classes = [JSONParser, MultiPartJSONParser]
     filter_backends = [
-        filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend
+        filters.OrderingFilter, DjangoFilterBackend, RecipeSearchFilter
     ]
     filterset_class = RecipeFilter
+    ordering_fields = (
+        'pub_date', 'name', 'cooking_time', 'favorites_count', 'cart_count'
+    )
     ordering = ('-pub_date',)
+    cursor_ordering = ('-pub_date', '-id')
 
     def get_permissions(self):
-        if self.action == 'download_shopping_cart':
+        if self.action in ['download_shopping_cart', 'feed']:
             return (IsAuthenticated(),)
         return super().get_permissions()
 
@@ -66,17 +83,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if self.action == 'shopping_cart':
             return ShoppingCart.objects.all()
-        if self.action == 'download_shopping_cart':
-            return RecipeIngredient.objects.filter(
-                recipe__shoppingcart__user=self.request.user
-            )
         if self.action == 'favorite':
             return Favorite.objects.all()
-        return Recipe.objects.all()
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        if isinstance(instance, ShoppingCart):
+            ShoppingListItem.objects.remove_recipe(
+                instance.user, instance.recipe
+            )
+        if isinstance(instance, Recipe):
+            ShoppingListItem.objects.update_recipe(instance, {
+                ingredient_id: -amount for ingredient_id, amount
+                in instance.ingredient_amounts().items()
+            })
+        instance.delete()
+
     def user_recipe_relation(self, request, data, **kwargs):
         user = self.request.user
         model = kwargs.get('model')
@@ -90,7 +118,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'recipe': recipe.id
             })
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
@@ -123,37 +152,76 @@ class RecipeViewSet(viewsets.ModelViewSet):
             error_message='Этот рецепт уже не находится у вас в избранном.'
         )
 
-    @action(methods=['get'], detail=False)
+    def get_feed_sources(self, user):
+        return FeedEntry.objects.sources(user)
+
+    @action(methods=['get'], detail=False, pagination_class=FeedPagination)
+    def feed(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=True)
+    def similar(self, request, *args, **kwargs):
+        recipe = get_object_or_404(Recipe, pk=kwargs.get('pk'))
+        recipes = self.get_queryset().filter(
+            similar_for__recipe=recipe
+        ).annotate(
+            similarity=F('similar_for__score')
+        ).order_by('-similarity', '-id')
+        serializer = self.get_serializer(recipes, many=True)
+        for data, similar in zip(serializer.data, recipes):
+            data['similarity'] = round(similar.similarity, 4)
+        return Response(serializer.data)
+
+    @action(methods=['get'], detail=False, pagination_class=LimitPagination)
+    def match(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            match_recipes(get_ingredient_ids(request))
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], matched, total)
+            for recipe_id, matched, total in page if recipe_id in recipes
+        ]
+        serializer = self.get_serializer(
+            [recipe for recipe, _, _ in page], many=True
+        )
+        for data, (_, matched, total) in zip(serializer.data, page):
+            data['matched_ingredients'] = matched
+            data['missing_ingredients'] = total - matched
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'], detail=False, pagination_class=LimitPagination,
+        filter_backends=[DjangoFilterBackend]
+    )
+    def trending(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(trending__isnull=False)
+        ).order_by('-trending__score', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'], detail=False,
+        renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer]
+    )
     def download_shopping_cart(self, request, *args, **kwargs):
-        recipes_ingredients = self.get_queryset()
-        recipes = recipes_ingredients.values(
-            'recipe__name',
-            'recipe__author__username'
-        ).distinct()
-        ingredients = recipes_ingredients.values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        shoppingcart = 'Список ингредиентов к покупке:\n'
-        shoppingcart += '\n'.join([
-            f'• {ingredient["ingredient__name"]}'
-            f' ({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shoppingcart += '\n\nСписок составлен для следующих рецептов:\n'
-        shoppingcart += '\n'.join([
-            f'• {recipe["recipe__name"]}'
-            f' - {recipe["recipe__author__username"]}'
-            for recipe in recipes
-        ])
-        shoppingcart += '\n\n---'
-        shoppingcart += '\nFoodgram | Продуктовый Помощник'
-
-        filename = '{}_shopping_cart.txt'.format(self.request.user)
-        response = HttpResponse(
-            shoppingcart, content_type='text.txt; charset=utf-8'
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+
+        filename = '{}_shopping_cart.{}'.format(
+            self.request.user, renderer.format
+        )
+        response = StreamingHttpResponse(
+            EXPORTERS[renderer.format](request.user),
+            content_type=content_type
         )
         response['Content-Disposition'] = (
             'attachment; filename={}'.format(filename)
@@ -161,13 +229,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return response
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
+    reference_name = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [
@@ -175,6 +244,7 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     ]
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+    reference_name = 'ingredients'
 
 
 class CustomUserViewSet(UserViewSet):
@@ -182,6 +252,11 @@ class CustomUserViewSet(UserViewSet):
         AllowAny,
     ]
     pagination_class = LimitPagination
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = (
+        'date_joined', 'username', 'recipes_count', 'followers_count'
+    )
+    cursor_ordering = ('-date_joined', '-id')
 
     def get_permissions(self):
         if self.action in [
@@ -201,13 +276,35 @@ class CustomUserViewSet(UserViewSet):
         if self.action == 'subscribe':
             return Follow.objects.all()
         if self.action == 'subscriptions':
-            return User.objects.filter(following__user=self.request.user)
-        return User.objects.all()
+            return User.objects.filter(
+                following__user=self.request.user
+            ).annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+            )
+        user = self.request.user
+        if user.is_anonymous:
+            return User.objects.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return User.objects.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, following=OuterRef('pk'))
+        ))
 
     @action(methods=['get'], detail=False)
     def subscriptions(self, request, *args, **kwargs):
+        recipes_limit = get_recipes_limit(request)
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
+
+        latest_recipes = defaultdict(list)
+        if page and recipes_limit:
+            for recipe in Recipe.objects.latest_by_author(
+                [author.id for author in page], recipes_limit
+            ):
+                latest_recipes[recipe.author_id].append(recipe)
+        for author in page:
+            author.latest_recipes = latest_recipes[author.id]
+
         serializer_context = {'request': request}
         serializer = self.get_serializer(
             page, context=serializer_context, many=True
@@ -226,7 +323,8 @@ class CustomUserViewSet(UserViewSet):
                 'following': author.id
             })
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
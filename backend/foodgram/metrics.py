@@ -0,0 +1,167 @@
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса: число и время SQL-запросов,
+    время сериализации.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, view_time):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'view;dur={view_time * 1000:.1f}',
+        ))
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def collect():
+    _local.metrics = RequestMetrics()
+    try:
+        yield _local.metrics
+    finally:
+        _local.metrics = None
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Учитывает только внешний вызов: вложенные сериализаторы
+    входят во время родительского.
+    """
+    metrics = current()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics.serializer_depth -= 1
+
+
+class Histogram:
+    """
+    Гистограмма в памяти процесса в формате Prometheus,
+    с разбивкой по представлению и действию.
+    """
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self.lock:
+            counts, total, count = self.values.get(
+                view, ([0] * len(self.buckets), 0, 0)
+            )
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[view] = (counts, total + value, count + 1)
+
+    def render(self):
+        with self.lock:
+            values = sorted(
+                (view, list(counts), total, count)
+                for view, (counts, total, count) in self.values.items()
+            )
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        for view, counts, total, count in values:
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            buckets = [*zip(self.buckets, counts), ('+Inf', count)]
+            lines.extend(
+                f'{self.name}_bucket{{view="{label}",le="{bound}"}} {bucket}'
+                for bound, bucket in buckets
+            )
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {count}')
+        return lines
+
+
+VIEW_SECONDS = Histogram(
+    'foodgram_view_seconds', 'Время обработки запроса.', DURATION_BUCKETS
+)
+DB_SECONDS = Histogram(
+    'foodgram_db_seconds', 'Суммарное время SQL-запросов.', DURATION_BUCKETS
+)
+SERIALIZER_SECONDS = Histogram(
+    'foodgram_serializer_seconds', 'Время сериализации ответа.',
+    DURATION_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries', 'Число SQL-запросов.', QUERY_BUCKETS
+)
+HISTOGRAMS = (VIEW_SECONDS, DB_SECONDS, SERIALIZER_SECONDS, DB_QUERIES)
+
+
+def observe(view, metrics, view_time):
+    VIEW_SECONDS.observe(view, view_time)
+    DB_SECONDS.observe(view, metrics.db_time)
+    SERIALIZER_SECONDS.observe(view, metrics.serializer_time)
+    DB_QUERIES.observe(view, metrics.queries)
+
+
+def metrics_allowed(request):
+    """
+    Доступ по заголовку «Authorization: Bearer <METRICS_TOKEN>»
+    или с адресов из METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    if not settings.METRICS_TOKEN:
+        return False
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    )
+
+
+def metrics_view(request):
+    """
+    Гистограммы текущего процесса; при нескольких воркерах
+    каждый отдаёт свои.
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return HttpResponse('\n'.join(lines) + '\n', content_type=CONTENT_TYPE)
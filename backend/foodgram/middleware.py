@@ -0,0 +1,72 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, nplusone
+
+
+def wrap_connections(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+def view_label(request):
+    """
+    Имя представления для метрик: для ViewSet — «Класс.действие».
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = match.func
+    view_class = getattr(view, 'cls', None)
+    if view_class is None:
+        return match.view_name or view.__name__
+    method = request.method.lower()
+    action = (getattr(view, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """
+    Считает SQL-запросы и время обработки запроса, отдаёт их в
+    заголовке Server-Timing и копит гистограммы для /api/_metrics.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with metrics.collect() as current, ExitStack() as stack:
+            wrap_connections(stack, current.execute)
+            started = time.perf_counter()
+            response = self.get_response(request)
+            view_time = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.url_name != 'metrics':
+            metrics.observe(view_label(request), current, view_time)
+        response['Server-Timing'] = current.server_timing(view_time)
+        return response
+
+
+class NPlusOneMiddleware:
+    """
+    Детектор N+1 запросов, включается настройкой NPLUSONE_MODE:
+    'log' пишет предупреждение в лог, 'raise' выбрасывает исключение.
+    """
+    def __init__(self, get_response):
+        if settings.NPLUSONE_MODE not in (nplusone.LOG, nplusone.RAISE):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = nplusone.NPlusOneDetector(
+            f'{request.method} {request.path}',
+            settings.NPLUSONE_THRESHOLD,
+            settings.NPLUSONE_MODE
+        )
+        with ExitStack() as stack:
+            wrap_connections(stack, detector.execute)
+            return self.get_response(request)
@@ -0,0 +1,97 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SPACES = re.compile(r'\s+')
+LOG = 'log'
+RAISE = 'raise'
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """
+    Форма запроса без значений: списки IN сворачиваются,
+    литералы заменяются на «?».
+    """
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = LITERALS.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def field_path(field):
+    names = []
+    while field is not None:
+        if field.field_name:
+            names.append(field.field_name)
+        top = field
+        field = field.parent
+    top = getattr(top, 'child', top)
+    return '.'.join((type(top).__name__, *reversed(names)))
+
+
+def find_source(frame):
+    """
+    Ближайшее к запросу поле сериализатора, а если запрос сделан
+    не из сериализатора — строка кода проекта.
+    """
+    location = None
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        name = frame.f_code.co_name
+        if isinstance(owner, Field):
+            if name in ('to_representation', 'get_attribute'):
+                return field_path(owner)
+            return f'{field_path(owner)}.{name}'
+        filename = frame.f_code.co_filename
+        if (
+            location is None
+            and filename.startswith(settings.BASE_DIR)
+            and filename != __file__
+            and f'{os.sep}site-packages{os.sep}' not in filename
+        ):
+            location = f'{filename}:{frame.f_lineno} ({name})'
+        frame = frame.f_back
+    return location or 'источник не найден'
+
+
+class NPlusOneDetector:
+    """
+    Считает одинаковые по форме SQL-запросы в рамках одного запроса
+    к API и сообщает о тех, что выполнились больше threshold раз.
+    """
+    def __init__(self, label, threshold, mode):
+        self.label = label
+        self.threshold = threshold
+        self.mode = mode
+        self.counts = Counter()
+        self.reported = set()
+
+    def execute(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if self.counts[shape] > self.threshold and shape not in self.reported:
+            self.reported.add(shape)
+            self.report(shape, find_source(sys._getframe(1)))
+        return execute(sql, params, many, context)
+
+    def report(self, shape, source):
+        message = (
+            f'N+1 в {self.label}: запрос выполнен больше '
+            f'{self.threshold} раз, источник {source}: {shape}'
+        )
+        if self.mode == RAISE:
+            raise NPlusOneError(message)
+        logger.warning(message)
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.MetricsMiddleware',
+    'foodgram.middleware.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -43,6 +45,16 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'foodgram.urls'
 
+TEST_RUNNER = 'foodgram.test_runner.NPlusOneTestRunner'
+
+NPLUSONE_MODE = os.getenv('NPLUSONE_MODE', default='')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=5))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', default='127.0.0.1,::1'
+).split(',')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -72,6 +84,45 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': os.getenv(
+            'REFERENCE_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'REFERENCE_CACHE_LOCATION',
+            default=os.path.join(BASE_DIR, '.cache')
+        ),
+    },
+}
+
+REFERENCE_CACHE_SIZE = 64
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+FEED_MAX_ENTRIES = 500
+FEED_BACKFILL_SIZE = 50
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+FEED_CELEBRITIES_TIMEOUT = 60 * 10
+
+TRENDING_HALF_LIFE = 60 * 60 * 24
+TRENDING_BACKFILL = 60 * 60 * 24 * 7
+TRENDING_EVENT_DELAY = 60
+TRENDING_FAVORITE_WEIGHT = 2.0
+TRENDING_CART_WEIGHT = 1.0
+TRENDING_MIN_SCORE = 0.05
+
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_TAG_WEIGHT = 0.2
+SIMILAR_MAX_SHARE = 0.05
+SIMILAR_MAX_POSTINGS = 10000
+SIMILAR_BATCH_SIZE = 256
+
 AUTH_USER_MODEL = "users.User"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -129,6 +180,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_SIZES = {
+    'small': (320, 320),
+    'medium': (960, 960),
+}
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv('RECIPE_IMAGE_MAX_BYTES', default=5 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_SIDE = 8000
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_SPOOL_MAX_SIZE = 1024 * 1024
+# JSON с картинкой в base64: сама картинка плюс треть на кодирование
+# и запас на остальные поля рецепта.
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024
+
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
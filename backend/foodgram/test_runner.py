@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .nplusone import RAISE
+
+
+class NPlusOneTestRunner(DiscoverRunner):
+    """
+    Тесты API идут с детектором N+1: повторяющийся запрос
+    завершает тест ошибкой NPlusOneError.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.nplusone_settings = override_settings(NPLUSONE_MODE=RAISE)
+        self.nplusone_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.nplusone_settings.disable()
+        super().teardown_test_environment(**kwargs)
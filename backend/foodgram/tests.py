@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings
+)
+
+from rest_framework.request import Request
+
+from api.serializers import RecipeRepresentationSerializer
+from recipes.models import Recipe, Tag
+from users.models import User
+
+from .metrics import metrics_view
+from .middleware import NPlusOneMiddleware
+from .nplusone import RAISE, NPlusOneError, fingerprint
+
+
+class NPlusOneTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        tag = Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        for number in range(settings.NPLUSONE_THRESHOLD + 1):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='Описание',
+                image='recipes/image.png', cooking_time=10
+            )
+            recipe.tags.add(tag)
+
+    def serialize_without_prefetch(self, request):
+        request.user = self.user
+        return RecipeRepresentationSerializer(
+            Recipe.objects.all(), many=True,
+            context={'request': Request(request)}
+        ).data
+
+    def test_runner_enables_raise_mode(self):
+        self.assertEqual(settings.NPLUSONE_MODE, RAISE)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) "
+                "AND name = 'it''s'  AND size = 15"
+            ),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? AND size = ?'
+        )
+
+    def test_middleware_reports_serializer_field(self):
+        middleware = NPlusOneMiddleware(self.serialize_without_prefetch)
+        with self.assertRaisesMessage(
+            NPlusOneError, 'RecipeRepresentationSerializer.'
+        ):
+            middleware(RequestFactory().get('/api/recipes/'))
+
+    def test_queries_below_threshold_pass(self):
+        middleware = NPlusOneMiddleware(
+            lambda request: HttpResponse(Recipe.objects.count())
+        )
+        response = middleware(RequestFactory().get('/api/recipes/'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(NPLUSONE_MODE='log')
+    def test_log_mode_does_not_raise(self):
+        middleware = NPlusOneMiddleware(self.serialize_without_prefetch)
+        with self.assertLogs('foodgram.nplusone', 'WARNING'):
+            middleware(RequestFactory().get('/api/recipes/'))
+
+
+@override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.1'])
+class MetricsViewTest(SimpleTestCase):
+
+    def get(self, remote_addr, **headers):
+        return metrics_view(RequestFactory().get(
+            '/api/_metrics', REMOTE_ADDR=remote_addr, **headers
+        ))
+
+    def test_allowed_ip(self):
+        self.assertEqual(self.get('10.0.0.1').status_code, 200)
+
+    def test_token(self):
+        response = self.get('10.0.0.2', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_forbidden_without_token(self):
+        self.assertEqual(self.get('10.0.0.2').status_code, 403)
+        response = self.get('10.0.0.2', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_is_disabled(self):
+        response = self.get('10.0.0.2', HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
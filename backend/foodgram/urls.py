@@ -3,7 +3,10 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from .metrics import metrics_view
+
 urlpatterns = [
+    path('api/_metrics', metrics_view, name='metrics'),
     path('api/', include('api.urls')),
     path('admin/', admin.site.urls),
 ]
@@ -5,18 +5,20 @@ from .models import (
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeSimilarity,
     ShoppingCart,
-    Tag
+    ShoppingListItem,
+    Tag,
+    TrendingRecipe
 )
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'pub_date')
+    list_display = (
+        'name', 'author', 'pub_date', 'favorites_count', 'cart_count'
+    )
     list_filter = ('name', 'author', 'tags')
-    readonly_fields = ('favorited_by',)
-
-    def favorited_by(self, obj):
-        return obj.favorited.count()
+    readonly_fields = ('favorites_count', 'cart_count')
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -30,3 +32,6 @@ admin.site.register(RecipeIngredient)
 admin.site.register(Tag)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
+admin.site.register(ShoppingListItem)
+admin.site.register(TrendingRecipe)
+admin.site.register(RecipeSimilarity)
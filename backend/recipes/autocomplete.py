@@ -0,0 +1,154 @@
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Ingredient
+from .versions import get_version
+
+AUTOCOMPLETE_LIMIT = 50
+SEPARATOR = '\n'
+
+
+class IngredientIndex:
+    """
+    Отсортированный массив названий ингредиентов в верхнем регистре:
+    совпадения по префиксу ищутся бинарным поиском, затем добираются
+    совпадения по подстроке поиском в склеенной строке всех названий.
+    """
+    def __init__(self, rows):
+        rows = sorted((name.upper(), pk) for pk, name in rows)
+        self.names = [name for name, _ in rows]
+        self.ids = [pk for _, pk in rows]
+        self.text = SEPARATOR.join(self.names)
+        self.starts = list(accumulate(
+            [0] + [len(name) + 1 for name in self.names[:-1]]
+        ))
+
+    def search(self, query, limit):
+        query = query.upper()
+        found = []
+        position = bisect_left(self.names, query)
+        while (
+            len(found) < limit
+            and position < len(self.names)
+            and self.names[position].startswith(query)
+        ):
+            found.append(self.ids[position])
+            position += 1
+
+        if len(found) >= limit or not query or SEPARATOR in query:
+            return found
+        offset = self.text.find(query)
+        while len(found) < limit and offset != -1:
+            number = bisect_right(self.starts, offset) - 1
+            if not self.names[number].startswith(query):
+                found.append(self.ids[number])
+            if number + 1 == len(self.starts):
+                break
+            offset = self.text.find(query, self.starts[number + 1])
+        return found
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_trigram_installed = {}
+
+
+def get_index():
+    global _index, _index_version
+    version, _ = get_version('ingredients')
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = IngredientIndex(
+                Ingredient.objects.values_list('id', 'name').iterator()
+            )
+            _index_version = version
+        return _index
+
+
+def warm_up():
+    """
+    Строит индекс при запуске процесса, чтобы его не ждал первый запрос
+    автодополнения. На Postgres поиск идёт по индексам в базе.
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor == 'postgresql':
+        return
+    try:
+        get_index()
+    except DatabaseError:
+        # Таблиц ещё нет (до migrate): индекс построит первый запрос.
+        pass
+
+
+def has_trigram(connection):
+    if connection.alias not in _trigram_installed:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_extension WHERE extname = %s', ['pg_trgm']
+            )
+            _trigram_installed[connection.alias] = (
+                cursor.fetchone() is not None
+            )
+    return _trigram_installed[connection.alias]
+
+
+def in_order(queryset, ids):
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *[When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        output_field=IntegerField()
+    ))
+
+
+def search_ingredients(queryset, query, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Ингредиенты, название которых начинается с query, затем содержащие
+    query; не больше limit штук.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return search_postgres(queryset, query, limit, connection)
+    return in_order(queryset, get_index().search(query, limit))
+
+
+def search_postgres(queryset, query, limit, connection):
+    """
+    Сначала совпадения по префиксу, затем, если их меньше limit,
+    совпадения по подстроке: по сходству триграмм (если есть pg_trgm)
+    и по названию. Префиксы упорядочены операторами text_pattern_ops:
+    в этом порядке строки отдаёт индекс по UPPER(name), и первые limit
+    читаются из индекса без сортировки всех совпадений.
+    """
+    sql, params = queryset.filter(name__istartswith=query).order_by(
+    ).values('pk').query.sql_with_params()
+    name = '{}.{}'.format(*map(connection.ops.quote_name, (
+        queryset.model._meta.db_table,
+        queryset.model._meta.get_field('name').column
+    )))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql} ORDER BY UPPER({name}) USING ~<~ LIMIT %s',
+            (*params, limit)
+        )
+        ids = [pk for pk, in cursor.fetchall()]
+    if len(ids) < limit:
+        contains = queryset.filter(name__icontains=query).exclude(
+            name__istartswith=query
+        )
+        ordering = ['name']
+        if has_trigram(connection):
+            contains = contains.annotate(
+                similarity=TrigramSimilarity('name', query)
+            )
+            ordering.insert(0, '-similarity')
+        ids += contains.order_by(*ordering).values_list(
+            'pk', flat=True
+        )[:limit - len(ids)]
+    return in_order(queryset, ids)
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow
+
+from .models import Favorite, Recipe, ShoppingCart
+from .versions import bump_version
+
+User = get_user_model()
+
+Counter = namedtuple(
+    'Counter', ('model', 'field', 'source', 'foreign_key', 'version')
+)
+
+# Счётчики не меняют дату изменения рецепта и версию 'users': иначе
+# каждое добавление в избранное сбрасывало бы ETag и кеш списков у всех.
+# В закешированных ответах значения счётчиков могут отставать; версия
+# COUNTERS_VERSION нужна только спискам, отсортированным по счётчику.
+COUNTERS_VERSION = 'recipe_counters'
+COUNTERS = (
+    Counter(Recipe, 'favorites_count', Favorite, 'recipe', COUNTERS_VERSION),
+    Counter(Recipe, 'cart_count', ShoppingCart, 'recipe', COUNTERS_VERSION),
+    Counter(User, 'recipes_count', Recipe, 'author', None),
+    Counter(User, 'followers_count', Follow, 'following', None),
+)
+
+
+def update_counter(counter, queryset, value):
+    updated = queryset.update(**{counter.field: value})
+    if updated and counter.version:
+        bump_version(counter.version)
+    return updated
+
+
+def change_counters(instance, delta):
+    """
+    Прибавляет delta к счётчикам, которые считают записи как instance.
+    Вызывается из сигналов в транзакции записи, значение меняется
+    в базе через F(), без чтения в Python.
+    """
+    for counter in COUNTERS:
+        if not isinstance(instance, counter.source):
+            continue
+        update_counter(
+            counter,
+            counter.model.objects.filter(
+                pk=getattr(instance, f'{counter.foreign_key}_id')
+            ),
+            Greatest(F(counter.field) + delta, 0)
+        )
+
+
+def reconcile(counter, batch_size):
+    """
+    Пересчитывает счётчик по исходной таблице диапазонами id по
+    batch_size строк, чтобы не держать блокировки на всей таблице.
+    Обновляются только разошедшиеся строки; возвращает их число.
+    """
+    actual = Coalesce(Subquery(
+        counter.source.objects.filter(
+            **{counter.foreign_key: OuterRef('pk')}
+        ).order_by().values(counter.foreign_key).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+    objects = counter.model.objects
+    last_id = objects.order_by('-pk').values_list('pk', flat=True).first()
+    fixed = 0
+    for start in range(0, (last_id or 0) + 1, batch_size):
+        fixed += update_counter(
+            counter,
+            objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).exclude(**{counter.field: actual}),
+            actual
+        )
+    return fixed
@@ -0,0 +1,127 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+FORMATS = (('jpeg', 'jpg', 'JPEG'), ('webp', 'webp', 'WEBP'))
+QUALITY = 85
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+    return _executor
+
+
+def available_formats():
+    return [
+        (key, extension, image_format)
+        for key, extension, image_format in FORMATS
+        if image_format != 'WEBP' or features.check('webp')
+    ]
+
+
+def variant_name(name, size, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}.{extension}'
+
+
+def variant_names(name):
+    return {
+        size: {
+            key: variant_name(name, size, extension)
+            for key, extension, _ in available_formats()
+        }
+        for size in settings.RECIPE_IMAGE_SIZES
+    }
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode in ('RGBA', 'LA'):
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(name):
+    """
+    Уменьшенные копии обложки в JPEG и WebP рядом с оригиналом.
+    Ориентация из EXIF применяется к пикселям, метаданные в копии
+    не переносятся; оригинал с EXIF заменяется очищенной копией.
+    """
+    field = Recipe._meta.get_field('image')
+    storage = field.storage
+    with storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    image_format = original.format
+    image = ImageOps.exif_transpose(original)
+    if image.mode not in ('RGB', 'RGBA', 'LA', 'L'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB'
+        )
+    for key in METADATA_KEYS:
+        image.info.pop(key, None)
+
+    if 'exif' in original.info and image_format in ('JPEG', 'PNG', 'WEBP'):
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, quality=95)
+        stripped = storage.save(
+            os.path.join(field.upload_to, os.path.basename(name)),
+            ContentFile(buffer.getvalue())
+        )
+        Recipe.objects.filter(image=name).update(image=stripped)
+        name = stripped
+
+    for size, box in settings.RECIPE_IMAGE_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail(box, Image.LANCZOS)
+        for _, extension, variant_format in available_formats():
+            storage.save_exact(
+                variant_name(name, size, extension),
+                ContentFile(encode(variant, variant_format))
+            )
+
+    Recipe.objects.filter(image=name).update(
+        image_variants=name, updated_at=timezone.now()
+    )
+
+
+def process_image(name):
+    try:
+        build_variants(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(name):
+    return get_executor().submit(process_image, name)
@@ -0,0 +1,383 @@
+import base64
+import io
+import json
+import math
+import resource
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from PIL import Image
+
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag
+)
+
+User = get_user_model()
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 120, 40)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет запросы ко всем эндпоинтам API через тестовый клиент '
+        'Django и выводит задержки (p50/p95/p99), число SQL-запросов '
+        'и потребление памяти в формате JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--read-only', action='store_true',
+            help='пропустить запросы, изменяющие данные'
+        )
+        parser.add_argument(
+            '--cart-size', type=int, default=0,
+            help=(
+                'добавить выгрузку списка покупок для корзины из стольких '
+                'рецептов (корзина создаётся на время замеров)'
+            )
+        )
+        parser.add_argument('--output', help='файл для отчёта')
+        parser.add_argument(
+            '--compare', help='отчёт предыдущего прогона для сравнения'
+        )
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        cart = ShoppingCart.objects.select_related('user').first()
+        if cart is None:
+            raise CommandError(
+                'Нет данных: сначала выполните generate_fake_data.'
+            )
+        return cart.user
+
+    def get_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host and host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    def make_client(self, user=None):
+        headers = {'HTTP_HOST': self.get_host()}
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        return Client(**headers)
+
+    def read_scenarios(self, user):
+        recipe = Recipe.objects.first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        return [
+            [('recipes-list', 'get', '/api/recipes/')],
+            [('recipes-list-filtered', 'get', (
+                f'/api/recipes/?tags={tag.slug}&is_favorited=1'
+                '&is_in_shopping_cart=0'
+            ))],
+            [('recipes-list-cursor', 'get', '/api/recipes/?cursor=')],
+            [('recipes-search', 'get', (
+                f'/api/recipes/?search={recipe.name.split()[0]}'
+            ))],
+            [('recipes-search-filtered', 'get', (
+                f'/api/recipes/?search={recipe.name.split()[0]}'
+                f'&tags={tag.slug}'
+            ))],
+            [('recipes-detail', 'get', f'/api/recipes/{recipe.id}/')],
+            [('recipes-match', 'get', (
+                '/api/recipes/match/?ingredients=' + ','.join(
+                    str(pk) for pk in recipe.ingredients.values_list(
+                        'id', flat=True
+                    )[:3]
+                )
+            ))],
+            *self.download_scenarios('recipes-download'),
+            [('tags-list', 'get', '/api/tags/')],
+            [('tags-detail', 'get', f'/api/tags/{tag.id}/')],
+            [('ingredients-list', 'get', '/api/ingredients/')],
+            [('ingredients-search', 'get', (
+                f'/api/ingredients/?name={ingredient.name[:2]}'
+            ))],
+            [('ingredients-detail', 'get', (
+                f'/api/ingredients/{ingredient.id}/'
+            ))],
+            [('users-list', 'get', '/api/users/')],
+            [('users-detail', 'get', f'/api/users/{recipe.author_id}/')],
+            [('users-me', 'get', '/api/users/me/')],
+            [('users-subscriptions', 'get', '/api/users/subscriptions/')],
+        ]
+
+    def download_scenarios(self, prefix):
+        return [
+            [(
+                f'{prefix}-{export_format}', 'get',
+                '/api/recipes/download_shopping_cart/'
+                f'?format={export_format}'
+            )]
+            for export_format in ('txt', 'csv', 'pdf')
+        ]
+
+    def make_cart_user(self, size):
+        """
+        Пользователь с корзиной из size рецептов. Вызывается внутри
+        транзакции, которая потом откатывается.
+        """
+        user = User.objects.create_user(
+            username='benchmark_cart', email='benchmark_cart@example.com'
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.values_list(
+                'id', flat=True
+            )[:size]
+        )
+        ShoppingListItem.objects.rebuild([user.id])
+        return user
+
+    def write_scenarios(self, user):
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            favorited__user=user
+        ).exclude(shoppingcart__user=user).first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user
+        ).first()
+        if recipe is None or author is None:
+            return []
+        payload = {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in Ingredient.objects.values_list(
+                    'id', flat=True
+                )[:3]
+            ],
+            'tags': list(Tag.objects.values_list('id', flat=True)[:1]),
+            'image': png_base64(),
+            'name': 'Рецепт для замеров',
+            'text': 'Создан командой benchmark_api.',
+            'cooking_time': 10,
+        }
+        created = []
+        return [
+            [
+                ('recipes-favorite-add', 'post', (
+                    f'/api/recipes/{recipe.id}/favorite/'
+                )),
+                ('recipes-favorite-remove', 'delete', (
+                    f'/api/recipes/{recipe.id}/favorite/'
+                )),
+            ],
+            [
+                ('recipes-cart-add', 'post', (
+                    f'/api/recipes/{recipe.id}/shopping_cart/'
+                )),
+                ('recipes-cart-remove', 'delete', (
+                    f'/api/recipes/{recipe.id}/shopping_cart/'
+                )),
+            ],
+            [
+                ('users-subscribe', 'post', (
+                    f'/api/users/{author.id}/subscribe/'
+                )),
+                ('users-unsubscribe', 'delete', (
+                    f'/api/users/{author.id}/subscribe/'
+                )),
+            ],
+            [
+                ('recipes-create', 'post', '/api/recipes/', payload, created),
+                ('recipes-update', 'patch', (
+                    lambda: f'/api/recipes/{created[-1]}/'
+                ), dict(payload, name='Рецепт для замеров (изменён)')),
+                ('recipes-delete', 'delete', (
+                    lambda: f'/api/recipes/{created.pop()}/'
+                )),
+            ],
+        ]
+
+    def request(self, client, step):
+        """
+        Время до первого байта и полное время ответа (потоковый ответ
+        читается целиком, но не склеивается) и SQL-запросы.
+        """
+        name, method, path, data, created = (*step, None, None)[:5]
+        if callable(path):
+            path = path()
+        body = json.dumps(data) if data is not None else ''
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.generic(
+                method.upper(), path, body, content_type='application/json'
+            )
+            first_byte = time.perf_counter() - started
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    if chunk:
+                        break
+                first_byte = time.perf_counter() - started
+                for chunk in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        if created is not None and response.status_code == 201:
+            created.append(response.json()['id'])
+        return (
+            name, method, path, response.status_code, first_byte, elapsed,
+            queries
+        )
+
+    def run_group(self, client, group, results):
+        for step in group:
+            name, method, path, status, first_byte, elapsed, queries = (
+                self.request(client, step)
+            )
+            result = results.setdefault(name, {
+                'method': method.upper(), 'path': path,
+                'statuses': set(), 'timings': [], 'first_bytes': [],
+                'queries': [], 'peak_kb': 0,
+            })
+            result['statuses'].add(status)
+            result['timings'].append(elapsed)
+            result['first_bytes'].append(first_byte)
+            result['queries'].append(len(queries))
+
+    def trace_group(self, client, group, results):
+        """
+        Пик памяти Python на каждый запрос группы (tracemalloc замедляет
+        выполнение, поэтому это отдельный проход без учёта времени).
+        """
+        for step in group:
+            tracemalloc.start()
+            try:
+                name = self.request(client, step)[0]
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            results[name]['peak_kb'] = max(
+                results[name]['peak_kb'], peak // 1024
+            )
+
+    def summarize(self, result):
+        timings = result['timings']
+        return {
+            'method': result['method'],
+            'path': result['path'],
+            'status': sorted(result['statuses']),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+            'first_byte_p50_ms': round(
+                percentile(result['first_bytes'], 50) * 1000, 2
+            ),
+            'peak_kb': result['peak_kb'],
+            'queries': max(result['queries']),
+        }
+
+    def compare(self, report, path):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)['endpoints']
+        print(f'{"эндпоинт":32} {"p95, мс":>18} {"запросы":>10}')
+        for name, current in report['endpoints'].items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            print(
+                f'{name:32} {before["p95_ms"]:>8} → {current["p95_ms"]:<8}'
+                f' {before["queries"]:>4} → {current["queries"]:<4}'
+            )
+
+    def run_groups(self, clients, groups, results, options):
+        for client_name, group in groups:
+            client = clients[client_name]
+            for _ in range(options['warmup']):
+                self.run_group(client, group, {})
+            for _ in range(options['iterations']):
+                self.run_group(client, group, results)
+            self.trace_group(client, group, results)
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        clients = {
+            'anonymous': self.make_client(),
+            'user': self.make_client(user),
+        }
+        groups = [('user', group) for group in self.read_scenarios(user)]
+        groups.insert(0, ('anonymous', [
+            ('recipes-list-anonymous', 'get', '/api/recipes/')
+        ]))
+        if not options['read_only']:
+            groups.extend(
+                ('user', group) for group in self.write_scenarios(user)
+            )
+
+        rss_start = max_rss_kb()
+        results = {}
+        self.run_groups(clients, groups, results, options)
+        if options['cart_size']:
+            with transaction.atomic():
+                cart_client = self.make_client(
+                    self.make_cart_user(options['cart_size'])
+                )
+                self.run_groups(
+                    {'cart': cart_client},
+                    [
+                        ('cart', group) for group in self.download_scenarios(
+                            f'recipes-download-{options["cart_size"]}'
+                        )
+                    ],
+                    results, options
+                )
+                transaction.set_rollback(True)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'rss_kb': {'start': rss_start, 'peak': max_rss_kb()},
+            'endpoints': {
+                name: self.summarize(result)
+                for name, result in results.items()
+            },
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            print(output)
+        if options['compare']:
+            self.compare(report, options['compare'])
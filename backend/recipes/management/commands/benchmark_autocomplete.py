@@ -0,0 +1,95 @@
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.autocomplete import IngredientIndex, search_ingredients
+from recipes.management.commands.benchmark_api import max_rss_kb, percentile
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет автодополнение ингредиентов: индекс в памяти на '
+        'названиях из data/ingredients.json, размноженных до --rows строк '
+        '(или поиск по таблице в базе), в формате JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--database', action='store_true',
+            help='искать через search_ingredients по таблице в базе'
+        )
+
+    def synthetic_rows(self, count):
+        """
+        Названия из справочника с номером партии: «сахар 17».
+        """
+        path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+        with open(path, encoding='utf-8') as file:
+            names = [item['name'] for item in json.load(file)]
+        return (
+            (pk, f'{names[pk % len(names)]} {pk // len(names)}')
+            for pk in range(count)
+        )
+
+    def queries(self, names, count):
+        """
+        Начала названий длиной 1–3 символа и подстроки из середины.
+        """
+        chosen = []
+        for _ in range(count):
+            name = self.random.choice(names)
+            length = self.random.randint(1, 3)
+            start = self.random.choice((0, len(name) // 2))
+            chosen.append(name[start:start + length])
+        return chosen
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append(time.perf_counter() - started)
+        return {
+            f'search_{label}_ms': round(
+                percentile(timings, percent) * 1000, 3
+            )
+            for label, percent in (('p50', 50), ('p95', 95), ('p99', 99))
+        }
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        limit = options['limit']
+        rss_start = max_rss_kb()
+        if options['database']:
+            names = list(Ingredient.objects.values_list('name', flat=True))
+            queryset = Ingredient.objects.all()
+            report = {'rows': len(names)}
+
+            def search(query):
+                return list(search_ingredients(queryset, query, limit))
+        else:
+            started = time.perf_counter()
+            index = IngredientIndex(self.synthetic_rows(options['rows']))
+            report = {
+                'rows': len(index.names),
+                'build_s': round(time.perf_counter() - started, 2),
+            }
+            names = index.names
+
+            def search(query):
+                return index.search(query, limit)
+
+        report.update(self.measure(
+            search, self.queries(names, options['iterations'])
+        ))
+        report['rss_kb'] = {'start': rss_start, 'peak': max_rss_kb()}
+        print(json.dumps(report, ensure_ascii=False, indent=2))
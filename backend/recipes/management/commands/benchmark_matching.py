@@ -0,0 +1,92 @@
+import json
+import time
+
+from django.core.management import BaseCommand
+
+import numpy as np
+
+from recipes.management.commands.benchmark_api import max_rss_kb, percentile
+from recipes.matching import IngredientIndex, load_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет индекс подбора рецептов по ингредиентам на синтетических '
+        'данных (или на данных базы): построение, память, задержку '
+        'запроса и обновления рецепта, в формате JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--query-size', type=int, default=5,
+            help='ингредиентов в одном запросе'
+        )
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--database', action='store_true',
+            help='строить индекс из базы, а не из синтетических данных'
+        )
+
+    def synthetic_pairs(self, random, options):
+        """
+        Пары (ингредиент, рецепт) с популярностью ингредиентов по закону
+        Ципфа: соль и лук встречаются чаще шафрана.
+        """
+        recipes = options['recipes']
+        weights = 1 / np.arange(1, options['ingredients'] + 1)
+        weights /= weights.sum()
+        ingredient_ids = random.choice(
+            options['ingredients'], size=recipes * options['per_recipe'],
+            p=weights
+        ) + 1
+        recipe_ids = np.arange(1, recipes + 1).repeat(options['per_recipe'])
+        # Повторы ингредиента в одном рецепте убираются.
+        pairs = np.unique(ingredient_ids * (recipes + 1) + recipe_ids)
+        return pairs // (recipes + 1), pairs % (recipes + 1)
+
+    def handle(self, *args, **options):
+        random = np.random.RandomState(options['seed'])
+        rss_start = max_rss_kb()
+        if options['database']:
+            started = time.perf_counter()
+            index = load_index()
+        else:
+            pairs = self.synthetic_pairs(random, options)
+            started = time.perf_counter()
+            index = IngredientIndex(*pairs)
+        build = time.perf_counter() - started
+
+        ingredient_ids = np.array(sorted(index.postings))
+        queries, updates = [], []
+        for _ in range(options['iterations']):
+            chosen = random.choice(
+                ingredient_ids, size=options['query_size'], replace=False
+            ).tolist()
+            started = time.perf_counter()
+            result = index.match(chosen)
+            result[:options['page_size']]
+            queries.append(time.perf_counter() - started)
+
+            recipe_id = int(random.randint(1, len(index.sizes)))
+            started = time.perf_counter()
+            index.update(recipe_id, chosen)
+            updates.append(time.perf_counter() - started)
+
+        print(json.dumps({
+            'recipes': int(np.count_nonzero(index.sizes)),
+            'postings': int(sum(map(len, index.postings.values()))),
+            'build_s': round(build, 2),
+            'rss_kb': {'start': rss_start, 'peak': max_rss_kb()},
+            **{
+                f'{name}_{label}_ms': round(
+                    percentile(timings, percent) * 1000, 2
+                )
+                for name, timings in (('match', queries), ('update', updates))
+                for label, percent in (('p50', 50), ('p95', 95))
+            },
+        }, ensure_ascii=False, indent=2))
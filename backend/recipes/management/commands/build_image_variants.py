@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии обложек, для которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='пересоздать копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='')
+        if not options['all']:
+            names = names.exclude(image_variants=F('image'))
+        names = names.values_list('image', flat=True).distinct()
+        processed = 0
+        for name in list(names):
+            try:
+                build_variants(name)
+            except (OSError, ValueError) as error:
+                print(f'{name}: {error}')
+                continue
+            processed += 1
+        print(f'Обработано изображений: {processed}.')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.similarity import build_similarities, stale_recipe_ids
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты для рецептов с изменёнными '
+        'ингредиентами или тегами (с --all — для всех)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='пересчитать для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipe_ids = None if options['all'] else stale_recipe_ids()
+        total = build_similarities(recipe_ids)
+        elapsed = time.perf_counter() - started
+        print(
+            f'Пересчитаны похожие для {total} рецептов за {elapsed:.2f} с.'
+        )
@@ -0,0 +1,71 @@
+import os
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.images import variant_names
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы обложек и их уменьшенные копии, на которые '
+        'не ссылается ни один рецепт'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать, что будет удалено'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='не трогать файлы моложе стольких секунд: их рецепт '
+                 'может быть ещё не сохранён'
+        )
+
+    def referenced_names(self):
+        referenced = set()
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct()
+        for name in names.iterator():
+            referenced.add(name)
+            for formats in variant_names(name).values():
+                referenced.update(formats.values())
+        return referenced
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, os.path.join(directory, name))
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            print('Каталог с обложками пуст.')
+            return
+
+        referenced = self.referenced_names()
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        removed = 0
+        freed = 0
+        for name in self.walk(storage, directory):
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name) > threshold:
+                continue
+            freed += storage.size(name)
+            removed += 1
+            if options['dry_run']:
+                print(name)
+            else:
+                storage.delete(name)
+
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        print(f'{action}: {removed} файлов, {freed} байт.')
@@ -0,0 +1,117 @@
+import re
+from itertools import combinations
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+WATCHED_MODELS = (Recipe, Recipe.tags.through, Favorite, ShoppingCart)
+POSTGRES_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SEQ_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(.*)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит планы запросов списка рецептов для всех сочетаний '
+        'фильтров RecipeFilter и завершается с ошибкой, если таблица '
+        'читается последовательным сканированием'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для фильтров избранного и корзины'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='не проверять таблицы, в которых меньше строк'
+        )
+        parser.add_argument(
+            '--no-analyze', action='store_true',
+            help='не выполнять запросы (EXPLAIN без ANALYZE)'
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='печатать планы целиком'
+        )
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        favorite = Favorite.objects.select_related('user').first()
+        if favorite is None:
+            raise CommandError('Нет данных: сначала заполните базу.')
+        return favorite.user
+
+    def get_params(self):
+        author_id = Recipe.objects.values_list('author', flat=True).first()
+        return {
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'author': [str(author_id)],
+            'is_favorited': ['1'],
+            'is_in_shopping_cart': ['1'],
+        }
+
+    def get_watched_tables(self, min_rows):
+        return {
+            model._meta.db_table for model in WATCHED_MODELS
+            if model.objects.count() >= min_rows
+        }
+
+    def explain(self, queryset, analyze):
+        if connection.vendor == 'postgresql':
+            return queryset.explain(analyze=analyze, buffers=analyze)
+        return queryset.explain()
+
+    def seq_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return set(POSTGRES_SEQ_SCAN.findall(plan))
+        return {
+            table for table, rest in SQLITE_SEQ_SCAN.findall(plan)
+            if 'USING' not in rest
+        }
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        request = SimpleNamespace(user=user)
+        params = self.get_params()
+        watched = self.get_watched_tables(options['min_rows'])
+        print(f'Проверяемые таблицы: {", ".join(sorted(watched)) or "нет"}')
+
+        failures = []
+        for size in range(len(params) + 1):
+            for names in combinations(params, size):
+                data = QueryDict(mutable=True)
+                for name in names:
+                    data.setlist(name, params[name])
+                queryset = RecipeFilter(
+                    data,
+                    queryset=Recipe.objects.with_user_flags(user),
+                    request=request
+                ).qs.order_by('-pub_date', '-id')[:PAGE_SIZE]
+
+                plan = self.explain(queryset, not options['no_analyze'])
+                scans = self.seq_scans(plan) & watched
+                label = ', '.join(names) or 'без фильтров'
+                if scans:
+                    failures.append(label)
+                    print(f'[SEQ SCAN] {label}: {", ".join(sorted(scans))}')
+                else:
+                    print(f'[OK] {label}')
+                if options['verbose_plans'] or scans:
+                    print(plan)
+
+        if failures:
+            raise CommandError(
+                f'Последовательное сканирование в {len(failures)} '
+                'сочетаниях фильтров.'
+            )
+        print('Все планы используют индексы.')
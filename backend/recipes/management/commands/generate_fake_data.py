@@ -0,0 +1,252 @@
+import csv
+import io
+import random
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.matching import rebuild_index
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TrendingRecipe
+)
+from recipes.search import postgres_bulk_load
+from recipes.versions import bump_version
+from users.models import Follow
+
+User = get_user_model()
+
+PASSWORD = 'fake-password'
+IMAGE = 'recipes/fake.png'
+PERIOD = 365 * 24 * 60 * 60
+NULL = '\\N'
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'котлеты',
+    'блины', 'плов', 'борщ', 'омлет', 'паста', 'соус', 'десерт',
+    'домашний', 'быстрый', 'летний', 'острый', 'сырный', 'овощной',
+    'грибной', 'куриный', 'рыбный', 'бабушкин', 'праздничный',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу случайными пользователями, рецептами, '
+        'подписками, избранным и корзинами для нагрузочных проверок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='одинаковый seed даёт одинаковые данные'
+        )
+
+    def insert(self, model, fields, rows):
+        """
+        Вставка пачками: COPY на Postgres, executemany на остальных базах.
+        Сигналы моделей не отправляются, поля auto_now не перезаписываются,
+        остальные поля получают значения по умолчанию.
+        """
+        model_fields = [model._meta.get_field(field) for field in fields]
+        omitted = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key and field not in model_fields
+        ]
+        defaults = tuple(field.get_default() for field in omitted)
+        model_fields += omitted
+        rows = (tuple(row) + defaults for row in rows)
+        started = time.monotonic()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) < self.batch_size:
+                continue
+            total += self.insert_batch(model, model_fields, batch)
+            batch = []
+        if batch:
+            total += self.insert_batch(model, model_fields, batch)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(
+            f'{model._meta.db_table}: {total} строк, '
+            f'{total / elapsed:.0f} строк/с'
+        )
+
+    def insert_batch(self, model, fields, batch):
+        table = model._meta.db_table
+        columns = ', '.join(field.column for field in fields)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    [NULL if value is None else value for value in row]
+                    for row in batch
+                )
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({columns}) FROM STDIN '
+                    f"WITH (FORMAT csv, NULL '{NULL}')",
+                    buffer
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'VALUES ({placeholders})',
+                    [
+                        [
+                            field.get_db_prep_save(value, connection)
+                            for field, value in zip(fields, row)
+                        ]
+                        for row in batch
+                    ]
+                )
+        return len(batch)
+
+    def bulk_load(self):
+        """
+        На Postgres внешние ключи проверяются сразу после каждой пачки,
+        а не все разом при COMMIT, а поисковые документы рецептов
+        считаются один раз после загрузки связей.
+        """
+        if connection.vendor != 'postgresql':
+            return nullcontext()
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        return postgres_bulk_load(connection)
+
+    def sample(self, population, size, exclude=None):
+        chosen = self.random.sample(
+            population, min(size + 1, len(population))
+        )
+        return [item for item in chosen if item != exclude][:size]
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.random.randrange(PERIOD))
+
+    def user_rows(self, count):
+        password = make_password(PASSWORD)
+        for number in range(count):
+            username = f'{self.prefix}{number}'
+            yield (
+                username, f'{username}@example.com',
+                f'Имя{number}'[:16], f'Фамилия{number}'[:16],
+                password, False, False, True, self.timestamp()
+            )
+
+    def recipe_rows(self, count, author_ids):
+        for number in range(count):
+            name = ' '.join(self.random.sample(WORDS, 3)).capitalize()
+            created = self.timestamp()
+            yield (
+                self.random.choice(author_ids), f'{name} №{number}',
+                ' '.join(self.random.choices(WORDS, k=40)), IMAGE,
+                self.random.randint(5, 180), created, created
+            )
+
+    def pair_rows(self, left_ids, right_ids, per_item, exclude_self=False):
+        for left_id in left_ids:
+            exclude = left_id if exclude_self else None
+            for right_id in self.sample(right_ids, per_item, exclude):
+                yield left_id, right_id
+
+    def timed_rows(self, rows):
+        for row in rows:
+            yield (*row, self.timestamp())
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'fake{options["seed"]}_'
+        self.now = timezone.now()
+
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги '
+                '(load_ingredients_data, load_tags_data).'
+            )
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Данные с seed={options["seed"]} уже созданы.'
+            )
+
+        self.insert(User, (
+            'username', 'email', 'first_name', 'last_name', 'password',
+            'is_superuser', 'is_staff', 'is_active', 'date_joined'
+        ), self.user_rows(options['users']))
+        user_ids = list(User.objects.filter(
+            username__startswith=self.prefix
+        ).order_by('id').values_list('id', flat=True))
+
+        with self.bulk_load():
+            self.insert(Recipe, (
+                'author_id', 'name', 'text', 'image', 'cooking_time',
+                'pub_date', 'updated_at'
+            ), self.recipe_rows(options['recipes'], user_ids))
+            recipe_ids = list(Recipe.objects.filter(
+                author_id__in=user_ids
+            ).order_by('id').values_list('id', flat=True))
+
+            self.insert(
+                RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'), (
+                    (recipe_id, ingredient_id, self.random.randint(1, 500))
+                    for recipe_id, ingredient_id in self.pair_rows(
+                        recipe_ids, ingredient_ids,
+                        options['ingredients_per_recipe']
+                    )
+                )
+            )
+            self.insert(
+                Recipe.tags.through, ('recipe_id', 'tag_id'), self.pair_rows(
+                    recipe_ids, tag_ids, options['tags_per_recipe']
+                )
+            )
+        self.insert(Follow, ('user_id', 'following_id'), self.pair_rows(
+            user_ids, user_ids, options['follows_per_user'],
+            exclude_self=True
+        ))
+        self.insert(
+            Favorite, ('user_id', 'recipe_id', 'created'), self.timed_rows(
+                self.pair_rows(
+                    user_ids, recipe_ids, options['favorites_per_user']
+                )
+            )
+        )
+        self.insert(
+            ShoppingCart, ('user_id', 'recipe_id', 'created'),
+            self.timed_rows(self.pair_rows(
+                user_ids, recipe_ids, options['cart_per_user']
+            ))
+        )
+
+        ShoppingListItem.objects.rebuild(user_ids)
+        FeedEntry.objects.rebuild(user_ids)
+        call_command('reconcile_counters')
+        TrendingRecipe.objects.refresh()
+        transaction.on_commit(rebuild_index)
+        for name in ('users', 'recipes'):
+            bump_version(name)
+        print(f'Готово. Пароль пользователей {self.prefix}*: {PASSWORD}')
@@ -0,0 +1,66 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from foodgram.settings import BASE_DIR
+from recipes.reference_data import DATASETS, READERS, ReferenceDataError, load
+from recipes.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты или теги из CSV или JSON. Существующие '
+        'записи обновляются по естественному ключу, повторный запуск '
+        'безопасен'
+    )
+    data_path = os.path.join(BASE_DIR, 'data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument(
+            'path', nargs='?',
+            help='файл с данными, по умолчанию из каталога data'
+        )
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='формат файла, по умолчанию по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='строк в одном пакете'
+        )
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]
+        path = options['path'] or os.path.join(
+            self.data_path, dataset.file_name
+        )
+        file_format = (
+            options['format'] or os.path.splitext(path)[1][1:].lower()
+        )
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат {file_format!r}, укажите --format.'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        print(f'Загрузка {options["dataset"]} из {path}...')
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                total = load(
+                    dataset,
+                    READERS[file_format](file, dataset.fields),
+                    options['batch_size']
+                )
+        except (OSError, ReferenceDataError) as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+        bump_version(dataset.version)
+        print(
+            f'Обработано строк: {total} за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с), '
+            f'в таблице {dataset.model.objects.count()}.'
+        )
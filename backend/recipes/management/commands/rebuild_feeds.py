@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок или, с --trim, обрезает их до '
+        'FEED_MAX_ENTRIES записей (для периодического запуска)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя (можно указать несколько раз)'
+        )
+        parser.add_argument(
+            '--trim', action='store_true',
+            help='только удалить записи сверх FEED_MAX_ENTRIES'
+        )
+
+    def handle(self, *args, **options):
+        if options['trim']:
+            deleted = FeedEntry.objects.trim(options['user_ids'])
+            print(f'Удалено записей из лент: {deleted}.')
+            return
+        print('Пересборка лент подписок...')
+        FeedEntry.objects.rebuild(options['user_ids'])
+        print(f'Готово, записей в лентах: {FeedEntry.objects.count()}.')
@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок по содержимому корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        print('Пересчёт списков покупок...')
+        ShoppingListItem.objects.rebuild(options['user_ids'])
+        print(
+            f'Готово, позиций в списках: {ShoppingListItem.objects.count()}.'
+        )
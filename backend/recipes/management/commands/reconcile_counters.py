@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+        'с исходными таблицами и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='строк в одном UPDATE'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        for counter in COUNTERS:
+            fixed = reconcile(counter, options['batch_size'])
+            print(
+                f'{counter.model._meta.model_name}.{counter.field}: '
+                f'исправлено строк {fixed}.'
+            )
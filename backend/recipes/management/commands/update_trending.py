@@ -0,0 +1,31 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import TrendingRecipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярных рецептов по новым добавлениям '
+        'в избранное и в корзину (для периодического запуска)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='пересчитать с нуля за TRENDING_BACKFILL секунд'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['rebuild']:
+                TrendingRecipe.objects.all().delete()
+            events = TrendingRecipe.objects.refresh()
+        print(
+            f'Учтено событий: {events} за '
+            f'{time.perf_counter() - started:.2f} с, '
+            f'в рейтинге рецептов: {TrendingRecipe.objects.count()}.'
+        )
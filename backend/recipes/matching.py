@@ -0,0 +1,221 @@
+import threading
+from itertools import islice
+
+import numpy as np
+
+from .models import RecipeIngredient
+from .versions import bump_version, get_version, reference_cache
+
+INDEX_VERSION = 'recipe_ingredients'
+CHANGES_KEY = 'matching:changes:{}'
+CHANGES_TIMEOUT = 60 * 60 * 24
+REBUILD = 'rebuild'
+FETCH_SIZE = 100000
+ID_TYPE = np.int32
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+class IngredientIndex:
+    """
+    Инвертированный индекс: ингредиент → отсортированный массив id
+    рецептов, плюс число ингредиентов каждого рецепта (по id рецепта).
+    """
+    def __init__(self, ingredient_ids, recipe_ids):
+        order = np.lexsort((recipe_ids, ingredient_ids))
+        ingredient_ids = ingredient_ids[order]
+        recipe_ids = recipe_ids[order].astype(ID_TYPE)
+        self.postings = {}
+        if len(ingredient_ids):
+            bounds = np.flatnonzero(np.diff(ingredient_ids)) + 1
+            starts = np.concatenate(([0], bounds))
+            self.postings = dict(zip(
+                ingredient_ids[starts].tolist(), np.split(recipe_ids, bounds)
+            ))
+        self.sizes = np.bincount(recipe_ids).astype(ID_TYPE)
+
+    def update(self, recipe_id, ingredient_ids):
+        """
+        Заменяет ингредиенты рецепта; пустой набор убирает рецепт.
+        """
+        ingredient_ids = set(ingredient_ids)
+        for ingredient_id, posting in list(self.postings.items()):
+            position = np.searchsorted(posting, recipe_id)
+            present = (
+                position < len(posting) and posting[position] == recipe_id
+            )
+            if present and ingredient_id not in ingredient_ids:
+                self.postings[ingredient_id] = np.delete(posting, position)
+            elif not present and ingredient_id in ingredient_ids:
+                self.postings[ingredient_id] = np.insert(
+                    posting, position, recipe_id
+                )
+        for ingredient_id in ingredient_ids - set(self.postings):
+            self.postings[ingredient_id] = np.array([recipe_id], ID_TYPE)
+        if recipe_id >= len(self.sizes):
+            self.sizes = np.concatenate((
+                self.sizes, np.zeros(recipe_id + 1 - len(self.sizes), ID_TYPE)
+            ))
+        self.sizes[recipe_id] = len(ingredient_ids)
+
+    def match(self, ingredient_ids):
+        return MatchResult(self, ingredient_ids)
+
+
+class MatchResult:
+    """
+    Рецепты, в которых есть хотя бы один из ингредиентов, в порядке
+    убывания доли ингредиентов рецепта, которые есть у пользователя,
+    затем числа совпавших ингредиентов и id. Срез вычисляет только
+    нужную верхушку рейтинга (для пагинатора).
+    """
+    def __init__(self, index, ingredient_ids):
+        postings = [
+            index.postings[ingredient_id] for ingredient_id
+            in set(ingredient_ids) if ingredient_id in index.postings
+        ]
+        if postings:
+            counts = np.bincount(
+                np.concatenate(postings), minlength=len(index.sizes)
+            )
+            self.recipe_ids = np.flatnonzero(counts)
+        else:
+            counts = np.zeros(0, ID_TYPE)
+            self.recipe_ids = np.zeros(0, np.intp)
+        self.matched = counts[self.recipe_ids]
+        self.sizes = index.sizes[self.recipe_ids]
+        self.coverage = self.matched / np.maximum(self.sizes, 1)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def top(self, count):
+        """
+        Позиции первых count рецептов рейтинга. Сортируется только
+        верхушка: кандидаты с долей не ниже count-й по величине.
+        """
+        candidates = np.arange(len(self))
+        if count < len(self):
+            threshold = np.partition(self.coverage, -count)[-count]
+            candidates = np.flatnonzero(self.coverage >= threshold)
+        order = np.lexsort((
+            -self.recipe_ids[candidates],
+            -self.matched[candidates],
+            -self.coverage[candidates],
+        ))
+        return candidates[order][:count]
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError('Поддерживаются только срезы с шагом 1.')
+        start, stop, _ = item.indices(len(self))
+        positions = self.top(stop)[start:] if stop > start else []
+        return [
+            (
+                int(self.recipe_ids[position]), int(self.matched[position]),
+                int(self.sizes[position])
+            )
+            for position in positions
+        ]
+
+
+def load_index():
+    pairs = RecipeIngredient.objects.values_list(
+        'ingredient_id', 'recipe_id'
+    ).iterator(chunk_size=FETCH_SIZE)
+    chunks = []
+    while True:
+        chunk = list(islice(pairs, FETCH_SIZE))
+        if not chunk:
+            break
+        chunks.append(np.array(chunk, ID_TYPE))
+    pairs = (
+        np.concatenate(chunks) if chunks else np.zeros((0, 2), ID_TYPE)
+    )
+    return IngredientIndex(pairs[:, 0], pairs[:, 1])
+
+
+def apply_changes(index, recipe_ids):
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe_id].append(ingredient_id)
+    for recipe_id, ingredient_ids in ingredients.items():
+        index.update(recipe_id, ingredient_ids)
+
+
+def read_changes(since, version):
+    """
+    Id рецептов, изменённых в версиях после since, и последняя версия,
+    для которой журнал есть. Записи последних версий могут ещё не
+    появиться в кеше, их подхватит следующий запрос. None, если
+    в журнале пропуск или отметка о перестроении и индекс нужно
+    строить заново.
+    """
+    keys = [
+        CHANGES_KEY.format(number) for number in range(since + 1, version + 1)
+    ]
+    changes = reference_cache().get_many(keys)
+    recipe_ids = set()
+    for number, key in enumerate(keys, start=since + 1):
+        if key not in changes:
+            if any(later in changes for later in keys[number - since:]):
+                return None
+            return recipe_ids, number - 1
+        if changes[key] == REBUILD:
+            return None
+        recipe_ids.update(changes[key])
+    return recipe_ids, version
+
+
+def get_index():
+    """
+    Индекс текущего процесса, сверенный с общей версией: изменения из
+    журнала в кеше применяются к индексу, а если журнал неполон
+    (вытеснен, сброшен кеш или массовая загрузка), индекс строится
+    заново из базы.
+    """
+    global _index, _index_version
+    version = get_version(INDEX_VERSION)[0]
+    with _index_lock:
+        if _index is not None and _index_version == version:
+            return _index
+        changes = None
+        if _index is not None and _index_version < version:
+            changes = read_changes(_index_version, version)
+        if changes is None:
+            _index = load_index()
+        else:
+            recipe_ids, version = changes
+            apply_changes(_index, recipe_ids)
+        _index_version = version
+        return _index
+
+
+def ingredients_changed(recipe_ids):
+    """
+    Отмечает в журнале, что ингредиенты рецептов recipe_ids изменились.
+    Вызывается после фиксации транзакции.
+    """
+    version = bump_version(INDEX_VERSION)
+    reference_cache().set(
+        CHANGES_KEY.format(version), list(recipe_ids), CHANGES_TIMEOUT
+    )
+
+
+def rebuild_index():
+    """
+    Требует перестроить индекс во всех процессах (после массовой
+    загрузки рецептов в обход сериализаторов).
+    """
+    version = bump_version(INDEX_VERSION)
+    reference_cache().set(
+        CHANGES_KEY.format(version), REBUILD, CHANGES_TIMEOUT
+    )
+
+
+def match_recipes(ingredient_ids):
+    return get_index().match(ingredient_ids)
@@ -1,9 +1,38 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Prefetch,
+    Q,
+    Sum,
+    Value,
+    When,
+    Window
+)
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from users.models import Follow
+
+from .storage import HashedMediaStorage
 
 MIN_COOKING_TIME = 1
 MIN_INGREDIENTS_AMOUNT = 0.1
+REBUILD_BATCH_SIZE = 2000
+CELEBRITIES_CACHE_KEY = 'feed:celebrities'
+FEED_ORDERING = ('-pub_date', '-recipe_id')
 
 User = get_user_model()
 
@@ -20,6 +49,14 @@ class Ingredient(models.Model):
         help_text='Выберите единицу измерения',
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+
     def __str__(self) -> str:
         return f'{self.name} ({self.measurement_unit})'
 
@@ -46,6 +83,62 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    @staticmethod
+    def related_lookups():
+        return (
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups()
+        )
+
+    def latest_by_author(self, author_ids, limit):
+        """
+        Первые limit рецептов каждого автора одним запросом
+        (ROW_NUMBER по партициям авторов).
+        """
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.recipe_rank <= %s '
+            'ORDER BY ranked.recipe_rank',
+            (*params, limit)
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author')
+            ))
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -69,9 +162,16 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        storage=HashedMediaStorage(),
         verbose_name='Обложка',
         help_text='Загрузите картинку готового блюда',
     )
+    image_variants = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Обложка, для которой готовы уменьшенные копии'
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления (в минутах)',
         help_text=('Укажите время необходимое для приготовления (в минутах)'),
@@ -81,13 +181,56 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах'
+    )
+    similar_stale = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Похожие рецепты нужно пересчитать'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['id'], condition=Q(similar_stale=True),
+                name='recipe_similar_stale_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def ingredient_amounts(self):
+        return dict(self.recipe_ingredients.values_list(
+            'ingredient_id', 'amount'
+        ))
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -129,12 +272,19 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorited'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True
+    )
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'], name='unique_favorite')
         ]
+        indexes = [
+            models.Index(fields=['created'], name='favorite_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Рецепт {self.recipe} в избранном у {self.user}'
@@ -151,12 +301,476 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='shoppingcart'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True
+    )
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'], name='unique_shoppingcart')
         ]
+        indexes = [
+            models.Index(
+                fields=['created'], name='shopping_cart_created_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'Рецепт {self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def apply(self, user_ids, amounts):
+        """
+        Прибавляет amounts ({id ингредиента: количество}) к спискам покупок
+        пользователей user_ids. Отрицательные значения вычитаются,
+        обнулившиеся позиции удаляются.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, amount in amounts.items()
+                    if amount > 0
+                ],
+                ignore_conflicts=True
+            )
+            items.update(total_amount=Greatest(
+                F('total_amount') + Case(
+                    *[
+                        When(ingredient_id=ingredient_id, then=Value(amount))
+                        for ingredient_id, amount in amounts.items()
+                    ],
+                    output_field=IntegerField()
+                ),
+                Value(0)
+            ))
+            items.filter(total_amount=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.apply([user.id], recipe.ingredient_amounts())
+
+    def remove_recipe(self, user, recipe):
+        self.apply([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipe.ingredient_amounts().items()
+        })
+
+    def update_recipe(self, recipe, amounts):
+        """
+        Применяет изменения количеств ингредиентов рецепта ко всем
+        спискам покупок, в которые он добавлен.
+        """
+        self.apply(
+            list(recipe.shoppingcart.values_list('user_id', flat=True)),
+            amounts
+        )
+
+    def rebuild(self, user_ids=None):
+        totals = RecipeIngredient.objects.filter(
+            recipe__shoppingcart__isnull=False
+        )
+        items = self.all()
+        if user_ids is not None:
+            totals = totals.filter(recipe__shoppingcart__user_id__in=user_ids)
+            items = items.filter(user_id__in=user_ids)
+        totals = totals.values_list(
+            'recipe__shoppingcart__user_id', 'ingredient_id'
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+        with transaction.atomic():
+            items.delete()
+            batch = []
+            for user_id, ingredient_id, total_amount in totals.iterator():
+                batch.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total_amount
+                ))
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    self.bulk_create(batch)
+                    batch = []
+            self.bulk_create(batch)
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return (f'{self.ingredient} - {self.total_amount} '
+                f'в списке покупок у {self.user}')
+
+
+def celebrity_ids():
+    """
+    id авторов, у которых больше FEED_FANOUT_LIMIT подписчиков: их
+    рецепты не раскладываются по лентам, а читаются при запросе ленты.
+    Список кешируется на FEED_CELEBRITIES_TIMEOUT секунд.
+    """
+    ids = cache.get(CELEBRITIES_CACHE_KEY)
+    if ids is None:
+        ids = list(User.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('id', flat=True))
+        cache.set(
+            CELEBRITIES_CACHE_KEY, ids, settings.FEED_CELEBRITIES_TIMEOUT
+        )
+    return ids
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    def fan_out(self, recipe):
+        """
+        Добавляет новый рецепт в ленты подписчиков автора. Если их
+        больше FEED_FANOUT_LIMIT, автор считается популярным и его
+        рецепты читаются при запросе ленты.
+        """
+        limit = settings.FEED_FANOUT_LIMIT
+        if recipe.author_id in celebrity_ids():
+            return
+        followers = list(Follow.objects.filter(
+            following_id=recipe.author_id
+        ).values_list('user_id', flat=True)[:limit + 1])
+        if len(followers) > limit:
+            cache.delete(CELEBRITIES_CACHE_KEY)
+            return
+        self.bulk_create(
+            [
+                FeedEntry(
+                    user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+                )
+                for user_id in followers
+            ],
+            ignore_conflicts=True
+        )
+
+    def add_author(self, user_id, author_id):
+        """
+        Заполняет ленту после подписки последними рецептами автора.
+        """
+        if author_id in celebrity_ids():
+            return
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        self.bulk_create(
+            [
+                FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                          pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            ignore_conflicts=True
+        )
+
+    def remove_author(self, user_id, author_id):
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+    def sources(self, user):
+        """
+        Выборки для ленты user с порядком сортировки, каждая читается
+        по своему индексу: записи ленты и рецепты популярных авторов
+        из подписок. Значения сортировки — (pub_date, id рецепта).
+        """
+        sources = [(self.filter(user=user), FEED_ORDERING)]
+        celebrities = celebrity_ids()
+        if celebrities:
+            authors = list(Follow.objects.filter(
+                user=user, following_id__in=celebrities
+            ).values_list('following_id', flat=True))
+            if authors:
+                sources.append((
+                    Recipe.objects.filter(author_id__in=authors),
+                    ('-pub_date', '-id')
+                ))
+        return sources
+
+    def ranked(self, user_ids=None):
+        """
+        Записи лент с номером по порядку в ленте каждого пользователя
+        (SQL и параметры).
+        """
+        entries = self.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        return entries.annotate(feed_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('pub_date').desc(), F('recipe_id').desc()]
+        )).values('id', 'feed_rank').query.sql_with_params()
+
+    def trim(self, user_ids=None):
+        """
+        Оставляет в каждой ленте не больше FEED_MAX_ENTRIES записей.
+        """
+        sql, params = self.ranked(user_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.model._meta.db_table} WHERE id IN '
+                f'(SELECT ranked.id FROM ({sql}) ranked '
+                'WHERE ranked.feed_rank > %s)',
+                (*params, settings.FEED_MAX_ENTRIES)
+            )
+            return cursor.rowcount
+
+    def rebuild(self, user_ids=None):
+        """
+        Собирает ленты заново из подписок: последние FEED_MAX_ENTRIES
+        рецептов авторов, кроме популярных.
+        """
+        follows = Follow.objects.exclude(following_id__in=celebrity_ids())
+        entries = self.all()
+        if user_ids is not None:
+            follows = follows.filter(user_id__in=user_ids)
+            entries = entries.filter(user_id__in=user_ids)
+        sql, params = follows.annotate(
+            recipe_id=F('following__recipes__id'),
+            pub_date=F('following__recipes__pub_date'),
+            feed_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('user_id')],
+                order_by=[
+                    F('following__recipes__pub_date').desc(),
+                    F('following__recipes__id').desc()
+                ]
+            )
+        ).filter(recipe_id__isnull=False).values(
+            'user_id', 'recipe_id', 'pub_date', 'feed_rank'
+        ).query.sql_with_params()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            entries.delete()
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                '(user_id, recipe_id, pub_date) '
+                'SELECT ranked.user_id, ranked.recipe_id, ranked.pub_date '
+                f'FROM ({sql}) ranked WHERE ranked.feed_rank <= %s',
+                (*params, settings.FEED_MAX_ENTRIES)
+            )
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Дата публикации рецепта
+    продублирована, чтобы страница ленты читалась одним проходом
+    по индексу (user, -pub_date, -recipe).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class TrendingRecipeQuerySet(models.QuerySet):
+    def events(self, since, until):
+        """
+        Добавления в избранное и в корзину за (since, until]:
+        (id рецепта, время, вес).
+        """
+        sources = (
+            (Favorite, settings.TRENDING_FAVORITE_WEIGHT),
+            (ShoppingCart, settings.TRENDING_CART_WEIGHT),
+        )
+        for model, weight in sources:
+            events = model.objects.filter(
+                created__gt=since, created__lte=until
+            ).values_list('recipe_id', 'created')
+            for recipe_id, created in events.iterator():
+                yield recipe_id, created, weight
+
+    def lock(self):
+        """
+        Блокировка пересчёта до конца транзакции: на Postgres —
+        advisory lock, на SQLite запись и так идёт в один поток.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(hashtext(%s))',
+                    [self.model._meta.db_table]
+                )
+
+    def refresh(self, now=None):
+        """
+        Пересчитывает рейтинг к моменту now: накопленные оценки
+        затухают с периодом полураспада TRENDING_HALF_LIFE, к ним
+        прибавляются события после прошлого пересчёта (для пустой
+        таблицы — за TRENDING_BACKFILL секунд). Записи с оценкой ниже
+        TRENDING_MIN_SCORE удаляются. Возвращает число событий.
+        События берутся с запаздыванием TRENDING_EVENT_DELAY: запись,
+        зафиксированная не позже чем через столько секунд после своего
+        created, попадает в следующий пересчёт, а не теряется.
+        Параллельный пересчёт ждёт окончания текущего.
+        """
+        now = now or timezone.now()
+        half_life = settings.TRENDING_HALF_LIFE
+        delay = timedelta(seconds=settings.TRENDING_EVENT_DELAY)
+        with transaction.atomic():
+            self.lock()
+            since = self.aggregate(since=Max('computed_at'))['since']
+            if since is None:
+                since = now - timedelta(seconds=settings.TRENDING_BACKFILL)
+            elif since >= now:
+                return 0
+            self.update(
+                score=F('score') * 0.5 ** (
+                    (now - since).total_seconds() / half_life
+                ),
+                computed_at=now
+            )
+
+            scores = defaultdict(float)
+            total = 0
+            events = self.events(since - delay, now - delay)
+            for recipe_id, created, weight in events:
+                scores[recipe_id] += weight * 0.5 ** (
+                    (now - created).total_seconds() / half_life
+                )
+                total += 1
+            existing = self.in_bulk(list(scores))
+            for recipe_id, trending in existing.items():
+                trending.score += scores.pop(recipe_id)
+            self.bulk_update(
+                existing.values(), ['score'], batch_size=REBUILD_BATCH_SIZE
+            )
+            self.bulk_create(
+                [
+                    TrendingRecipe(
+                        recipe_id=recipe_id, score=score, computed_at=now
+                    )
+                    for recipe_id, score in scores.items()
+                ],
+                batch_size=REBUILD_BATCH_SIZE
+            )
+            self.filter(score__lt=settings.TRENDING_MIN_SCORE).delete()
+        return total
+
+
+class TrendingRecipe(models.Model):
+    """
+    Оценка популярности рецепта: сумма добавлений в избранное и
+    в корзину с весами, затухающая со временем. Пересчитывается
+    командой update_trending, хранится только для рецептов с
+    заметной оценкой.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending'
+    )
+    score = models.FloatField(
+        verbose_name='Оценка'
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата пересчёта'
+    )
+
+    objects = TrendingRecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe}: {self.score:.2f}'
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Один из SIMILAR_RECIPES_COUNT самых похожих на recipe рецептов
+    по ингредиентам и тегам. Пересчитывается командой
+    build_similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_for'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_recipe_similarity'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similarity_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.similar} похож на {self.recipe}: {self.score:.2f}'
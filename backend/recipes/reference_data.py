@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+
+from .models import Ingredient, Tag
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+STAGING_TABLE = 'reference_data_staging'
+
+Dataset = namedtuple(
+    'Dataset', ('model', 'fields', 'key', 'file_name', 'version')
+)
+
+DATASETS = {
+    'ingredients': Dataset(
+        Ingredient, ('name', 'measurement_unit'),
+        ('name', 'measurement_unit'), 'ingredients.csv', 'ingredients'
+    ),
+    'tags': Dataset(
+        Tag, ('name', 'slug', 'color'), ('slug',), 'tags.json', 'tags'
+    ),
+}
+
+
+class ReferenceDataError(Exception):
+    pass
+
+
+def read_csv(file, fields):
+    """
+    Строки CSV по порядку полей; строка-заголовок с именами полей
+    пропускается.
+    """
+    for number, row in enumerate(csv.reader(file), start=1):
+        if not row:
+            continue
+        if number == 1 and tuple(row) == fields:
+            continue
+        if len(row) != len(fields):
+            raise ReferenceDataError(
+                f'Строка {number}: ожидалось {len(fields)} значения, '
+                f'получено {len(row)}.'
+            )
+        yield tuple(value.strip() for value in row)
+
+
+def read_json_objects(file):
+    """
+    Объекты из JSON-массива по одному, без чтения файла целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    eof = opened = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            if not opened:
+                if buffer[position] != '[':
+                    raise ReferenceDataError('Ожидался массив JSON.')
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                pass
+            else:
+                yield value
+                continue
+        # Объект не поместился в буфер целиком — дочитываем файл.
+        if eof:
+            raise ReferenceDataError('Файл JSON оборван или неверен.')
+        chunk = file.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def read_json(file, fields):
+    for number, item in enumerate(read_json_objects(file), start=1):
+        try:
+            yield tuple(str(item[field]).strip() for field in fields)
+        except (KeyError, TypeError):
+            raise ReferenceDataError(
+                f'Объект {number}: нужны поля {", ".join(fields)}.'
+            )
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def upsert_sql(dataset, source):
+    table = dataset.model._meta.db_table
+    columns = ', '.join(dataset.fields)
+    key = ', '.join(dataset.key)
+    updates = [field for field in dataset.fields if field not in dataset.key]
+    if updates:
+        action = 'DO UPDATE SET ' + ', '.join(
+            f'{field} = EXCLUDED.{field}' for field in updates
+        )
+    else:
+        action = 'DO NOTHING'
+    return (
+        f'INSERT INTO {table} ({columns}) {source} '
+        f'ON CONFLICT ({key}) {action}'
+    )
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_copy(dataset, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    columns = ', '.join(dataset.fields)
+    key = ', '.join(dataset.key)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        # DISTINCT ON: ON CONFLICT DO UPDATE не допускает двух строк
+        # с одним ключом в одной команде.
+        cursor.execute(upsert_sql(
+            dataset,
+            f'SELECT DISTINCT ON ({key}) {columns} FROM {STAGING_TABLE}'
+        ))
+        cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+
+
+def write_insert(dataset, rows):
+    placeholders = ', '.join(['%s'] * len(dataset.fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            upsert_sql(dataset, f'VALUES ({placeholders})'), rows
+        )
+
+
+def load(dataset, rows, batch_size):
+    """
+    Загрузка с upsert по естественному ключу пакетами по batch_size
+    строк. На Postgres пакет копируется (COPY) во временную таблицу и
+    переносится одним INSERT ... SELECT ... ON CONFLICT, на остальных
+    базах — через executemany с тем же ON CONFLICT.
+    Возвращает число обработанных строк.
+    """
+    total = 0
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            write = write_copy
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+                    f'ON COMMIT DROP AS SELECT {", ".join(dataset.fields)} '
+                    f'FROM {dataset.model._meta.db_table} WITH NO DATA'
+                )
+        else:
+            write = write_insert
+        for batch in batches(rows, batch_size):
+            write(dataset, batch)
+            total += len(batch)
+    return total
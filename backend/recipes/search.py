@@ -0,0 +1,281 @@
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+
+RECIPE_TABLE = Recipe._meta.db_table
+FTS_TABLE = 'recipes_recipe_search'
+# Связанные таблицы, названия из которых попадают в поисковый документ:
+# (колонка FTS5, таблица связи, внешний ключ, таблица названий).
+RELATED = (
+    ('ingredients', RecipeIngredient._meta.db_table, 'ingredient_id',
+     Ingredient._meta.db_table),
+    ('tags', Recipe.tags.through._meta.db_table, 'tag_id',
+     Tag._meta.db_table),
+)
+# Веса колонок name, text, ingredients, tags для bm25.
+FTS_WEIGHTS = '10.0, 1.0, 4.0, 4.0'
+WORD = re.compile(r'\w+')
+
+_fts5_available = {}
+
+
+def related_names(recipe_id, link_table, column, table, aggregate):
+    return (
+        f"(SELECT {aggregate}(t.name, ' ') FROM {link_table} l "
+        f'JOIN {table} t ON t.id = l.{column} '
+        f'WHERE l.recipe_id = {recipe_id})'
+    )
+
+
+def postgres_document(row):
+    """
+    Выражение tsvector для строки рецепта row: название (вес A),
+    ингредиенты и теги (B), описание (C). Подставляется в запросы
+    целиком: вызов SQL-функции на каждую строку в разы медленнее.
+    """
+    config = settings.RECIPE_SEARCH_CONFIG
+    parts = [(f'{row}.name', 'A')] + [
+        (related_names(f'{row}.id', link_table, column, table, 'string_agg'),
+         'B')
+        for _, link_table, column, table in RELATED
+    ] + [(f'{row}.text', 'C')]
+    return ' || '.join(
+        f"setweight(to_tsvector('{config}', coalesce({value}, '')), "
+        f"'{weight}')"
+        for value, weight in parts
+    )
+
+
+def postgres_refresh():
+    return (
+        f'UPDATE {RECIPE_TABLE} r '
+        f'SET search_vector = {postgres_document("r")}'
+    )
+
+
+def postgres_load_triggers():
+    """
+    Триггеры, которые пересчитывают документ при вставке рецептов
+    и связей: (таблица, имя триггера).
+    """
+    triggers = [(RECIPE_TABLE, 'recipes_search_update')]
+    for _, link_table, *_ in RELATED:
+        triggers += [
+            (link_table, 'recipes_search_insert'),
+            (link_table, 'recipes_search_delete'),
+        ]
+    return triggers
+
+
+@contextmanager
+def postgres_bulk_load(connection):
+    """
+    Массовая загрузка рецептов и связей внутри транзакции: триггеры
+    поиска отключаются до её конца, а документы новых рецептов
+    (search_vector IS NULL) считаются в конце одним UPDATE, а не
+    заново на каждую пачку связей. ALTER TABLE блокирует таблицы
+    рецептов и связей до конца транзакции.
+    """
+    triggers = postgres_load_triggers()
+    with connection.cursor() as cursor:
+        for table, trigger in triggers:
+            cursor.execute(f'ALTER TABLE {table} DISABLE TRIGGER {trigger}')
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute(f'{postgres_refresh()} WHERE r.search_vector IS NULL')
+        for table, trigger in triggers:
+            cursor.execute(f'ALTER TABLE {table} ENABLE TRIGGER {trigger}')
+
+
+def postgres_statements():
+    """
+    Колонка search_vector с индексом GIN, которую поддерживают триггеры
+    на рецептах, таблицах связей и переименовании ингредиентов и тегов.
+    Триггеры на связях срабатывают один раз на команду и обновляют все
+    затронутые рецепты одним UPDATE.
+    """
+    refresh = postgres_refresh()
+    statements = [
+        f'ALTER TABLE {RECIPE_TABLE} '
+        'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+
+        'CREATE OR REPLACE FUNCTION recipes_recipe_search_update() '
+        'RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+        f'NEW.search_vector := {postgres_document("NEW")}; '
+        'RETURN NEW; END $$',
+
+        'CREATE OR REPLACE FUNCTION recipes_recipe_search_refresh() '
+        'RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+        f'{refresh} WHERE r.id = ANY(ARRAY('
+        'SELECT DISTINCT recipe_id FROM changed)); '
+        'RETURN NULL; END $$',
+
+        f'DROP TRIGGER IF EXISTS recipes_search_update ON {RECIPE_TABLE}',
+        'CREATE TRIGGER recipes_search_update '
+        f'BEFORE INSERT OR UPDATE OF name, text ON {RECIPE_TABLE} '
+        'FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_update()',
+    ]
+    for name, link_table, column, table in RELATED:
+        for event, transition in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+            trigger = f'recipes_search_{event.lower()}'
+            statements += [
+                f'DROP TRIGGER IF EXISTS {trigger} ON {link_table}',
+                f'CREATE TRIGGER {trigger} AFTER {event} ON {link_table} '
+                f'REFERENCING {transition} TABLE AS changed '
+                'FOR EACH STATEMENT '
+                'EXECUTE PROCEDURE recipes_recipe_search_refresh()',
+            ]
+        function = f'recipes_recipe_search_rename_{name}'
+        statements += [
+            f'CREATE OR REPLACE FUNCTION {function}() '
+            'RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            f'{refresh} WHERE r.id = ANY(ARRAY('
+            f'SELECT recipe_id FROM {link_table} WHERE {column} = NEW.id)); '
+            'RETURN NULL; END $$',
+
+            f'DROP TRIGGER IF EXISTS recipes_search_rename ON {table}',
+            'CREATE TRIGGER recipes_search_rename '
+            f'AFTER UPDATE OF name ON {table} FOR EACH ROW '
+            'WHEN (OLD.name IS DISTINCT FROM NEW.name) '
+            f'EXECUTE PROCEDURE {function}()',
+        ]
+    return statements + [
+        'CREATE INDEX IF NOT EXISTS recipes_recipe_search_idx '
+        f'ON {RECIPE_TABLE} USING gin (search_vector)',
+        f'{refresh} WHERE r.search_vector IS NULL',
+    ]
+
+
+def sqlite_statements():
+    """
+    Таблица FTS5 с rowid, равным id рецепта, и триггеры, которые
+    поддерживают её в соответствии с рецептами и их связями.
+    """
+    columns = ', '.join(column for column, *_ in RELATED)
+    names = {
+        column: 'coalesce({}, \'\')'.format(related_names(
+            '{recipe_id}', link_table, foreign_key, table, 'group_concat'
+        ))
+        for column, link_table, foreign_key, table in RELATED
+    }
+    statements = [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+        f'USING fts5(name, text, {columns})',
+
+        'DROP TRIGGER IF EXISTS recipes_search_insert',
+        'CREATE TRIGGER recipes_search_insert '
+        f'AFTER INSERT ON {RECIPE_TABLE} BEGIN '
+        f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text, {columns}) '
+        f"VALUES (NEW.id, NEW.name, NEW.text, '', ''); END",
+
+        'DROP TRIGGER IF EXISTS recipes_search_update',
+        'CREATE TRIGGER recipes_search_update '
+        f'AFTER UPDATE OF name, text ON {RECIPE_TABLE} BEGIN '
+        f'UPDATE {FTS_TABLE} SET name = NEW.name, text = NEW.text '
+        'WHERE rowid = NEW.id; END',
+
+        'DROP TRIGGER IF EXISTS recipes_search_delete',
+        'CREATE TRIGGER recipes_search_delete '
+        f'AFTER DELETE ON {RECIPE_TABLE} BEGIN '
+        f'DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id; END',
+    ]
+    for column, link_table, foreign_key, table in RELATED:
+        for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+            trigger = f'recipes_search_{column}_{event.lower()}'
+            value = names[column].format(recipe_id=f'{row}.recipe_id')
+            statements += [
+                f'DROP TRIGGER IF EXISTS {trigger}',
+                f'CREATE TRIGGER {trigger} AFTER {event} ON {link_table} '
+                f'BEGIN UPDATE {FTS_TABLE} SET {column} = {value} '
+                f'WHERE rowid = {row}.recipe_id; END',
+            ]
+        trigger = f'recipes_search_{column}_rename'
+        value = names[column].format(recipe_id=f'{FTS_TABLE}.rowid')
+        statements += [
+            f'DROP TRIGGER IF EXISTS {trigger}',
+            f'CREATE TRIGGER {trigger} AFTER UPDATE OF name ON {table} '
+            f'BEGIN UPDATE {FTS_TABLE} SET {column} = {value} '
+            f'WHERE rowid IN (SELECT recipe_id FROM {link_table} '
+            f'WHERE {foreign_key} = NEW.id); END',
+        ]
+    values = ', '.join(
+        names[column].format(recipe_id='r.id') for column, *_ in RELATED
+    )
+    return statements + [
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text, {columns}) '
+        f'SELECT r.id, r.name, r.text, {values} FROM {RECIPE_TABLE} r '
+        f'WHERE r.id NOT IN (SELECT rowid FROM {FTS_TABLE})',
+    ]
+
+
+def has_fts5(connection):
+    if connection.alias not in _fts5_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5_available[connection.alias] = bool(cursor.fetchone()[0])
+    return _fts5_available[connection.alias]
+
+
+def search_statements(connection):
+    if connection.vendor == 'postgresql':
+        return postgres_statements()
+    if connection.vendor == 'sqlite' and has_fts5(connection):
+        return sqlite_statements()
+    return []
+
+
+def fts5_query(query):
+    """
+    Слова запроса как префиксы в кавычках: синтаксис FTS5 из
+    пользовательского ввода не интерпретируется, а префиксный поиск
+    отчасти заменяет отсутствующий в FTS5 стемминг.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, подходящие под поисковый запрос, и выражение релевантности
+    для сортировки по убыванию (None, если оценки нет). На Postgres
+    запрос разбирается websearch_to_tsquery с учётом морфологии, на
+    SQLite ищется через FTS5, на остальных базах — по вхождению в
+    название.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = [settings.RECIPE_SEARCH_CONFIG, query]
+        queryset = queryset.annotate(search_match=RawSQL(
+            f'{RECIPE_TABLE}.search_vector @@ {tsquery}', params,
+            output_field=BooleanField()
+        )).filter(search_match=True)
+        return queryset, RawSQL(
+            f'ts_rank({RECIPE_TABLE}.search_vector, {tsquery})', params,
+            output_field=FloatField()
+        )
+    if connection.vendor == 'sqlite' and has_fts5(connection):
+        expression = fts5_query(query)
+        if not expression:
+            return queryset.none(), None
+        # bm25() работает только при просмотре таблицы FTS5 по MATCH,
+        # поэтому таблица присоединяется к рецептам, а унарный плюс не
+        # даёт планировщику искать в ней по rowid.
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'+{FTS_TABLE}.rowid = {RECIPE_TABLE}.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[expression]
+        )
+        return queryset, RawSQL(
+            f'-bm25({FTS_TABLE}, {FTS_WEIGHTS})', [],
+            output_field=FloatField()
+        )
+    return queryset.filter(name__icontains=query), None
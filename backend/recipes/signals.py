@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from .counters import change_counters
+from .images import schedule_variants
+from .matching import ingredients_changed
+from .models import Favorite, FeedEntry, Ingredient, Recipe, ShoppingCart, Tag
+from .versions import bump_version
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(**kwargs):
+    bump_version('tags')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(**kwargs):
+    bump_version('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    name = instance.image.name
+    if name and instance.image_variants != name:
+        transaction.on_commit(lambda: schedule_variants(name))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: FeedEntry.objects.fan_out(instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: ingredients_changed([recipe_id]))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(**kwargs):
+    bump_version('users')
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Follow)
+def relation_changed(instance, **kwargs):
+    bump_version(f'relations:{instance.user_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.add_author(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    FeedEntry.objects.remove_author(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def counted_created(instance, created, **kwargs):
+    if created:
+        change_counters(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def counted_deleted(instance, **kwargs):
+    change_counters(instance, -1)
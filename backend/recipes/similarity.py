@@ -0,0 +1,251 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+import numpy as np
+
+from .models import Recipe, RecipeIngredient, RecipeSimilarity
+
+FETCH_SIZE = 100000
+ID_TYPE = np.int32
+SCORE_DIGITS = 9
+BINS = 1024
+
+
+def fetch_pairs(queryset, fields):
+    pairs = queryset.values_list(*fields).iterator(chunk_size=FETCH_SIZE)
+    chunks = []
+    while True:
+        chunk = list(islice(pairs, FETCH_SIZE))
+        if not chunk:
+            break
+        chunks.append(np.array(chunk, ID_TYPE))
+    if not chunks:
+        return np.zeros(0, ID_TYPE), np.zeros(0, ID_TYPE)
+    pairs = np.concatenate(chunks)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def ranges(starts, ends):
+    """
+    Склеенные диапазоны [starts[i], ends[i]) одним массивом.
+    """
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def kth_bound(rows, values, count, size):
+    """
+    Оценка снизу count-го по величине из values (от 0 до 1) в каждой
+    из size строк rows по гистограмме, без сортировки; -inf для строк,
+    где значений меньше count.
+    """
+    bins = np.minimum((values * BINS).astype(np.intp), BINS - 1)
+    enough = np.cumsum(np.bincount(
+        rows * BINS + bins, minlength=size * BINS
+    ).reshape(size, BINS)[:, ::-1], axis=1) >= count
+    return np.where(
+        enough[:, -1], (BINS - 1 - np.argmax(enough, axis=1)) / BINS, -np.inf
+    )
+
+
+def top_per_row(rows, values, count):
+    """
+    Позиции не более count наибольших values (от 0 до 1) в каждой
+    строке rows, по строкам и убыванию values, при равенстве — позже
+    идущие первыми. Вместо сортировки по трём
+    ключам — одна устойчивая сортировка по rows - values / 2.
+    """
+    backwards = np.arange(len(rows))[::-1]
+    order = backwards[
+        np.argsort((rows - values / 2)[::-1], kind='stable')
+    ]
+    ordered_rows = rows[order]
+    rank = np.arange(len(order)) - np.searchsorted(ordered_rows, ordered_rows)
+    return order[rank < count]
+
+
+class FeatureMatrix:
+    """
+    Разреженная матрица рецепт × ингредиент с весами IDF в двух
+    раскладках: по рецептам (CSR) и по ингредиентам (CSC), и матрица
+    тегов рецептов. Строки индексируются id рецепта, их не меньше size.
+    """
+    def __init__(self, recipe_ids, ingredient_ids, tag_recipe_ids, tag_ids,
+                 size=0):
+        size = max(
+            size, recipe_ids.max(initial=-1) + 1,
+            tag_recipe_ids.max(initial=-1) + 1
+        )
+        order = np.lexsort((ingredient_ids, recipe_ids))
+        self.columns = ingredient_ids[order]
+        self.row_pointers = np.searchsorted(
+            recipe_ids[order], np.arange(size + 1)
+        )
+        order = np.lexsort((recipe_ids, ingredient_ids))
+        self.postings = recipe_ids[order]
+        frequency = np.bincount(ingredient_ids)
+        self.column_pointers = np.concatenate(([0], np.cumsum(frequency)))
+        recipes = np.count_nonzero(np.bincount(recipe_ids))
+        self.idf = np.log((1 + recipes) / (1 + frequency)) + 1
+        self.rare = frequency <= max(min(
+            settings.SIMILAR_MAX_SHARE * recipes,
+            settings.SIMILAR_MAX_POSTINGS
+        ), 1)
+        self.norms = np.sqrt(np.bincount(
+            recipe_ids, weights=self.idf[ingredient_ids] ** 2,
+            minlength=size
+        ))
+        tag_columns = np.unique(tag_ids, return_inverse=True)[1]
+        self.tags = np.zeros(
+            (size, int(tag_columns.max(initial=-1)) + 1), bool
+        )
+        self.tags[tag_recipe_ids, tag_columns] = True
+
+    def neighbours(self, recipe_ids, count):
+        """
+        count ближайших соседей для каждого рецепта из recipe_ids:
+        массивы (рецепт, сосед, сходство). Сходство — косинус векторов
+        ингредиентов с весами IDF с долей SIMILAR_TAG_WEIGHT меры
+        Жаккара по тегам. Кандидаты и скалярные произведения считаются
+        только по редким ингредиентам (в доле рецептов не больше
+        SIMILAR_MAX_SHARE и не больше чем в SIMILAR_MAX_POSTINGS):
+        частые вроде соли почти не различают рецепты, а перебор их
+        списков квадратичен.
+        """
+        entries = ranges(
+            self.row_pointers[recipe_ids], self.row_pointers[recipe_ids + 1]
+        )
+        rows = np.repeat(
+            np.arange(len(recipe_ids)),
+            np.diff(self.row_pointers)[recipe_ids]
+        )
+        columns = self.columns[entries]
+        rows, columns = rows[self.rare[columns]], columns[self.rare[columns]]
+
+        starts = self.column_pointers[columns]
+        ends = self.column_pointers[columns + 1]
+        stride = len(self.norms)
+        keys = (
+            np.repeat(rows, ends - starts).astype(np.int64) * stride
+            + self.postings[ranges(starts, ends)]
+        )
+        keys, inverse = np.unique(keys, return_inverse=True)
+        dots = np.bincount(
+            inverse, weights=np.repeat(self.idf[columns] ** 2, ends - starts)
+        )
+        weight = settings.SIMILAR_TAG_WEIGHT
+        rows, candidates = keys // stride, keys % stride
+        recipes = recipe_ids[rows]
+        other = candidates != recipes
+        rows, recipes, candidates, dots = (
+            rows[other], recipes[other], candidates[other], dots[other]
+        )
+        base = (1 - weight) * dots / (
+            self.norms[recipes] * self.norms[candidates]
+        )
+
+        # Теги добавляют к сходству не больше weight: кандидаты, которым
+        # этого не хватит до count-го по косинусу, отбрасываются до
+        # сравнения тегов.
+        bound = kth_bound(rows, base, count, len(recipe_ids))
+        keep = base + weight >= bound[rows] - 10.0 ** -SCORE_DIGITS
+        rows, recipes, candidates, base = (
+            rows[keep], recipes[keep], candidates[keep], base[keep]
+        )
+
+        tags, candidate_tags = self.tags[recipes], self.tags[candidates]
+        jaccard = (tags & candidate_tags).sum(axis=1) / np.maximum(
+            (tags | candidate_tags).sum(axis=1), 1
+        )
+        # Округление делает равными сходства, которые отличаются лишь
+        # ошибкой вычислений, и их порядок не зависит от пакета.
+        scores = np.round(base + weight * jaccard, SCORE_DIGITS)
+        keep = scores >= kth_bound(rows, scores, count, len(recipe_ids))[rows]
+        rows, recipes, candidates, scores = (
+            rows[keep], recipes[keep], candidates[keep], scores[keep]
+        )
+        top = top_per_row(rows, scores, count)
+        return recipes[top], candidates[top], scores[top]
+
+
+def load_features(size):
+    recipe_ids, ingredient_ids = fetch_pairs(
+        RecipeIngredient.objects.all(), ('recipe_id', 'ingredient_id')
+    )
+    tag_recipe_ids, tag_ids = fetch_pairs(
+        Recipe.tags.through.objects.all(), ('recipe_id', 'tag_id')
+    )
+    return FeatureMatrix(
+        recipe_ids, ingredient_ids, tag_recipe_ids, tag_ids, size
+    )
+
+
+def stale_recipe_ids():
+    """
+    Рецепты, у которых изменились ингредиенты или теги, и рецепты,
+    в чьих списках похожих они есть. Отметки снимаются до чтения
+    данных: изменения во время пересчёта отметят рецепт заново.
+    """
+    stale = Recipe.objects.filter(similar_stale=True)
+    recipe_ids = set(stale.values_list('id', flat=True))
+    recipe_ids.update(RecipeSimilarity.objects.filter(
+        similar_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    stale.filter(id__in=recipe_ids).update(similar_stale=False)
+    return recipe_ids
+
+
+def save_neighbours(features, recipe_ids):
+    """
+    Пересчитывает и сохраняет соседей recipe_ids пакетами по
+    SIMILAR_BATCH_SIZE рецептов. Возвращает id найденных соседей.
+    """
+    found = set()
+    batch_size = settings.SIMILAR_BATCH_SIZE
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        recipes, similar, scores = features.neighbours(
+            batch, settings.SIMILAR_RECIPES_COUNT
+        )
+        found.update(similar.tolist())
+        with transaction.atomic():
+            RecipeSimilarity.objects.filter(
+                recipe_id__in=batch.tolist()
+            ).delete()
+            RecipeSimilarity.objects.bulk_create(
+                RecipeSimilarity(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score
+                )
+                for recipe_id, similar_id, score in zip(
+                    recipes.tolist(), similar.tolist(), scores.tolist()
+                )
+            )
+    return found
+
+
+def build_similarities(recipe_ids=None):
+    """
+    Пересчитывает похожие рецепты для recipe_ids, а затем для их новых
+    соседей: сходство симметрично, и изменённый рецепт скорее всего
+    должен попасть в их списки. Без recipe_ids пересчитывает все
+    рецепты. Возвращает число обработанных рецептов.
+    """
+    if recipe_ids is None:
+        Recipe.objects.filter(similar_stale=True).update(similar_stale=False)
+        recipe_ids = Recipe.objects.values_list('id', flat=True)
+        expand = False
+    else:
+        expand = True
+    recipe_ids = np.array(sorted(recipe_ids), ID_TYPE)
+    if not len(recipe_ids):
+        return 0
+    features = load_features(int(recipe_ids[-1]) + 1)
+    found = save_neighbours(features, recipe_ids)
+    if not expand:
+        return len(recipe_ids)
+    neighbours = np.array(sorted(found - set(recipe_ids.tolist())), ID_TYPE)
+    save_neighbours(features, neighbours)
+    return len(recipe_ids) + len(neighbours)
@@ -0,0 +1,49 @@
+from django.db import connections
+
+from .models import Ingredient, Recipe
+from .search import search_statements
+
+RECIPE_TAGS_TABLE = Recipe.tags.through._meta.db_table
+
+COMMON_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+    f'ON {RECIPE_TAGS_TABLE} (tag_id, recipe_id)',
+]
+
+POSTGRES_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_idx '
+    f'ON {Ingredient._meta.db_table} (UPPER(name) text_pattern_ops)',
+]
+
+TRIGRAM_STATEMENTS = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm_idx '
+    f'ON {Ingredient._meta.db_table} USING gin (UPPER(name) gin_trgm_ops)',
+]
+
+
+def extension_available(cursor, name):
+    cursor.execute(
+        'SELECT 1 FROM pg_available_extensions WHERE name = %s', [name]
+    )
+    return cursor.fetchone() is not None
+
+
+def create_database_objects(using, **kwargs):
+    """
+    Индексы и расширения, которые нельзя описать в Meta моделей
+    (функциональные индексы, классы операторов, индексы на
+    автоматически созданных таблицах связей) и объекты полнотекстового
+    поиска рецептов.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for statement in COMMON_STATEMENTS + search_statements(connection):
+            cursor.execute(statement)
+        if connection.vendor != 'postgresql':
+            return
+        for statement in POSTGRES_STATEMENTS:
+            cursor.execute(statement)
+        if extension_available(cursor, 'pg_trgm'):
+            for statement in TRIGRAM_STATEMENTS:
+                cursor.execute(statement)
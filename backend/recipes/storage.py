@@ -0,0 +1,54 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Хранилище с адресацией по содержимому: файл сохраняется под
+    sha256 своих байтов (recipes/ab/<digest>.<ext>) и записывается
+    один раз, повторная загрузка того же файла возвращает то же имя.
+    Ссылки считает collect_media_garbage по полям моделей.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        return super().save(
+            self.hashed_name(name, content), content, max_length
+        )
+
+    def save_exact(self, name, content):
+        """
+        Запись под заданным именем, для производных файлов
+        (уменьшенных копий), которые адресуются от имени оригинала.
+        Оригинал неизменен, поэтому существующая копия не переписывается:
+        её уже могли закешировать как immutable.
+        """
+        if self.exists(name):
+            return name
+        return super().save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        # Запись через временное имя и атомарное переименование:
+        # одновременная загрузка того же файла просто перезапишет
+        # его идентичным содержимым.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
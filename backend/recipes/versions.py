@@ -0,0 +1,42 @@
+import time
+
+from django.core.cache import caches
+
+CACHE_ALIAS = 'reference'
+VERSION_KEY = 'version:{}'
+MODIFIED_KEY = 'modified:{}'
+
+
+def reference_cache():
+    """
+    Кеш, общий для всех процессов: версии наборов данных и то, что
+    по ним читается (справочники, журнал изменений ингредиентов).
+    """
+    return caches[CACHE_ALIAS]
+
+
+def get_version(name):
+    """
+    Номер версии набора данных и время его последнего изменения.
+    Версия хранится в кеше reference и общая для всех процессов.
+    """
+    cache = reference_cache()
+    keys = (VERSION_KEY.format(name), MODIFIED_KEY.format(name))
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        cache.add(keys[0], 1, timeout=None)
+        cache.add(keys[1], int(time.time()), timeout=None)
+        values = cache.get_many(keys)
+    return values.get(keys[0], 1), values.get(keys[1], int(time.time()))
+
+
+def bump_version(name):
+    cache = reference_cache()
+    key = VERSION_KEY.format(name)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+        version = cache.incr(key)
+    cache.set(MODIFIED_KEY.format(name), int(time.time()), timeout=None)
+    return version
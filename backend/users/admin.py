@@ -4,8 +4,9 @@ from .models import Follow, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email')
+    list_display = ('username', 'email', 'recipes_count', 'followers_count')
     list_filter = ('username', 'email')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
 admin.site.register(User, UserAdmin)
@@ -12,6 +12,16 @@ class User(AbstractUser):
     last_name = models.CharField(
         max_length=16
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     class Meta:
         ordering = ['-date_joined']